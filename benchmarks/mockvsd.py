@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, Alcatel-Lucent Inc
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the names of its contributors
+#       may be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" Local VSD serving synthetic objects for benchmarks
+
+    Objects are never stored: the server holds `enterprises`, each
+    with `domains`, each with `vports`, and builds them from their
+    position when they are requested. Identifiers encode the type and
+    the position of objects, so that serving any page of any scale,
+    up to millions of objects, takes the same time and memory.
+
+    The server accepts any credentials, serves listings with paging
+    and filters, counts, and objects by identifier, optionally after
+    a fixed latency. It prints the URL of the API once listening.
+
+    Usage:
+        python benchmarks/mockvsd.py [--objects 1000] [--port 0] [--latency 0]
+
+"""
+
+import argparse
+import BaseHTTPServer
+import json
+import os
+import re
+import SocketServer
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from vsdcli.snapshot import SnapshotFilter
+
+API_KEY = '02a3ebf0-0b5b-4ab7-a9bb-cd6d1d9f8be4'
+FAN_OUT = 10
+LAST_UPDATED_DATE = 1500000000000
+VPORT_TYPES = ['VM', 'HOST', 'BRIDGE']
+
+# rest name, resource name, parent rest name, code used in identifiers
+TYPES = [('enterprise', 'enterprises', None, 1),
+         ('domain', 'domains', 'enterprise', 2),
+         ('vport', 'vports', 'domain', 3)]
+
+
+def get_shape(objects):
+    """ Returns the number of enterprises, domains per enterprise and vports per domain of a scale
+
+        Args:
+            objects: the approximate total number of objects
+
+    """
+    vports = max(1, (objects - FAN_OUT - FAN_OUT * FAN_OUT) // (FAN_OUT * FAN_OUT))
+
+    return (FAN_OUT, FAN_OUT, vports)
+
+
+class SyntheticVSD(object):
+    """ Objects of the synthetic VSD
+
+    """
+
+    def __init__(self, objects):
+        """ Initializes the objects
+
+            Args:
+                objects: the approximate total number of objects
+
+        """
+        (enterprises, domains, vports) = get_shape(objects)
+
+        self.counts = {'enterprise': enterprises, 'domain': enterprises * domains, 'vport': enterprises * domains * vports}
+        self.children = {'enterprise': domains, 'domain': vports}
+        self.rest_names = dict((resource_name, rest_name) for (rest_name, resource_name, parent, code) in TYPES)
+        self.parents = dict((rest_name, parent) for (rest_name, resource_name, parent, code) in TYPES)
+        self.codes = dict((rest_name, code) for (rest_name, resource_name, parent, code) in TYPES)
+        self.types = dict((code, rest_name) for (rest_name, resource_name, parent, code) in TYPES)
+
+    @property
+    def total(self):
+        """ The number of objects """
+
+        return sum(self.counts.values())
+
+    def get_id(self, rest_name, position):
+        """ Returns the identifier of an object """
+
+        return '%08x-0000-4000-8000-%012x' % (self.codes[rest_name], position)
+
+    def parse_id(self, identifier):
+        """ Returns the rest name and the position of an object or None """
+
+        match = re.match(r'^([0-9a-f]{8})-0000-4000-8000-([0-9a-f]{12})$', identifier)
+
+        if match is None:
+            return None
+
+        rest_name = self.types.get(int(match.group(1), 16))
+        position = int(match.group(2), 16)
+
+        if rest_name is None or position >= self.counts[rest_name]:
+            return None
+
+        return (rest_name, position)
+
+    def get_object(self, rest_name, position):
+        """ Returns the dictionary of an object """
+
+        parent_type = self.parents[rest_name]
+        parent_position = position // self.children[parent_type] if parent_type else None
+        obj = {
+            'ID': self.get_id(rest_name, position),
+            'parentID': self.get_id(parent_type, parent_position) if parent_type else None,
+            'parentType': parent_type,
+            'name': '%s%d' % (rest_name, position),
+            'description': 'Synthetic %s %d' % (rest_name, position),
+            'externalID': None,
+            'owner': self.get_id('enterprise', 0),
+            'creationDate': LAST_UPDATED_DATE,
+            'lastUpdatedDate': LAST_UPDATED_DATE,
+        }
+
+        if rest_name == 'vport':
+            obj['type'] = VPORT_TYPES[position % len(VPORT_TYPES)]
+            obj['VLAN'] = position % 4096
+            obj['active'] = position % 2 == 0
+
+        return obj
+
+    def get_range(self, rest_name, parent=None):
+        """ Returns the positions of the children of a parent, or of all objects without parent
+
+            Args:
+                rest_name: the rest name of the children
+                parent: a tuple (rest name, position) or None
+
+        """
+        if parent is None:
+            return (0, self.counts[rest_name])
+
+        (parent_type, parent_position) = parent
+
+        if self.parents[rest_name] != parent_type:
+            return None
+
+        size = self.children[parent_type]
+
+        return (parent_position * size, (parent_position + 1) * size)
+
+
+class VSDRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Handles requests of the VSD API
+
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def handle_request(self):
+        """ Serve the API """
+
+        vsd = self.server.vsd
+
+        # Bodies are ignored but read, so that the connection can be reused
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        match = re.match(r'^/nuage/api/v\d+_\d+/(.*)$', self.path.split('?')[0])
+
+        if match is None or not self.headers.get('Authorization'):
+            return self.send(401, {'errors': 'Unauthorized'})
+
+        parts = match.group(1).strip('/').split('/')
+
+        if parts == ['me']:
+            return self.send(200, [{'ID': 'b9a2c5a2-0000-4000-8000-000000000000', 'APIKey': API_KEY, 'APIKeyExpiry': (time.time() + 86400) * 1000,
+                                    'userName': 'csproot', 'enterpriseID': 'csp', 'enterpriseName': 'csp', 'role': 'CSPROOT'}])
+
+        if self.command not in ('GET', 'HEAD'):
+            return self.send(405, {'errors': 'The benchmark VSD is read only'})
+
+        if len(parts) == 1 and parts[0] in vsd.rest_names:
+            rest_name = vsd.rest_names[parts[0]]
+            return self.send_listing(rest_name, vsd.get_range(rest_name))
+
+        if len(parts) == 2 and parts[0] in vsd.rest_names:
+            obj = vsd.parse_id(parts[1])
+
+            if obj is None or obj[0] != vsd.rest_names[parts[0]]:
+                return self.send(404, {'errors': 'Object not found'})
+
+            return self.send(200, [vsd.get_object(*obj)])
+
+        if len(parts) == 3 and parts[2] in vsd.rest_names:
+            parent = vsd.parse_id(parts[1])
+            rest_name = vsd.rest_names[parts[2]]
+            positions = vsd.get_range(rest_name, parent) if parent else None
+
+            if positions is None:
+                return self.send(404, {'errors': 'Object not found'})
+
+            return self.send_listing(rest_name, positions)
+
+        self.send(404, {'errors': 'Unknown resource'})
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_DELETE = handle_request
+
+    def send_listing(self, rest_name, positions):
+        """ Send a page of objects
+
+            Objects are only built for the requested page, unless
+            a filter has to be evaluated on all of them.
+
+        """
+        vsd = self.server.vsd
+        (start, end) = positions
+        page = int(self.headers.get('X-Nuage-Page') or 0)
+        page_size = int(self.headers.get('X-Nuage-PageSize') or 50)
+        expression = self.headers.get('X-Nuage-Filter')
+
+        if expression:
+            try:
+                predicate = SnapshotFilter(expression)
+            except ValueError, e:
+                return self.send(400, {'errors': str(e)})
+
+            objects = [obj for obj in (vsd.get_object(rest_name, position) for position in xrange(start, end)) if predicate.match(obj)]
+            count = len(objects)
+            objects = objects[page * page_size:(page + 1) * page_size]
+        else:
+            count = end - start
+            first = start + page * page_size
+            objects = [vsd.get_object(rest_name, position) for position in xrange(first, min(end, first + page_size))] if self.command == 'GET' else []
+
+        headers = {'X-Nuage-Count': count, 'X-Nuage-Page': page, 'X-Nuage-PageSize': page_size}
+
+        if self.command == 'HEAD' or not objects:
+            return self.send(200 if self.command == 'HEAD' else 204, None, headers)
+
+        attributes = self.headers.get('X-Nuage-Attributes')
+
+        if attributes:
+            names = [name.strip() for name in attributes.split(',')] + ['ID']
+            objects = [dict((name, obj[name]) for name in names if name in obj) for obj in objects]
+
+        self.send(200, objects, headers)
+
+    def send(self, status, data=None, headers={}):
+        """ Send a response """
+
+        body = json.dumps(data) if data is not None and self.command != 'HEAD' else ''
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+
+        for (name, value) in headers.iteritems():
+            self.send_header(name, str(value))
+
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class VSDServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Threaded server of a synthetic VSD
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port, objects, latency=0):
+        """ Initializes the server
+
+            Args:
+                port: the port to listen to, 0 for any free port
+                objects: the approximate total number of objects
+                latency: the time in seconds added to every request
+
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), VSDRequestHandler)
+        self.vsd = SyntheticVSD(objects)
+        self.latency = latency
+
+    @property
+    def url(self):
+        """ The URL of the API endpoint """
+
+        return 'http://127.0.0.1:%s' % self.server_address[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local VSD serving synthetic objects')
+    parser.add_argument('--objects', type=int, default=1000, help='Approximate number of enterprises, domains and vports (default: 1000)')
+    parser.add_argument('--port', type=int, default=0, help='Port to listen to (default: any free port)')
+    parser.add_argument('--latency', type=float, default=0, help='Time in ms added to every request (default: 0)')
+    args = parser.parse_args()
+
+    server = VSDServer(args.port, args.objects, args.latency / 1000)
+    (enterprises, domains, vports) = get_shape(args.objects)
+
+    print(server.url)
+    sys.stdout.flush()
+    sys.stderr.write('%s objects: %s enterprises, %s domains per enterprise, %s vports per domain\n' % (server.vsd.total, enterprises, domains, vports))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015, Alcatel-Lucent Inc
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the names of its contributors
+#       may be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+""" Startup benchmark of the vsd command
+
+    Measures the time taken by `vsd --help` and by argument errors
+    compared to an empty python process, and checks that the heavy
+    modules needed to talk to the VSD are not imported before a
+    command runs. Exits with an error when a check fails.
+
+    Usage:
+        python benchmarks/startup.py [--runs 15] [--max-overhead 50]
+
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUN_VSD = 'import sys; sys.path.insert(0, %r); from vsdcli.vsd import main; main()' % ROOT
+HEAVY_MODULES = ['requests', 'bambou', 'colorama', 'tabulate', 'sqlite3', 'vsdcli.commands']
+LOADED_MODULES = """
+import sys
+sys.path.insert(0, %r)
+from vsdcli.vsd import get_parser
+get_parser().parse_args(['list', 'enterprises'])
+print(' '.join([name for name in %r if name in sys.modules]))
+""" % (ROOT, HEAVY_MODULES)
+
+SCENARIOS = [
+    ('help', ['--help']),
+    ('unknown command', ['lst']),
+    ('missing argument', ['list']),
+]
+
+
+def measure(arguments, runs, environment):
+    """ Returns the median duration in milliseconds of a python process
+
+    """
+    durations = []
+
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.call([sys.executable] + arguments, stdout=devnull, stderr=devnull, env=environment)
+            durations.append((time.time() - start) * 1000)
+
+    durations.sort()
+
+    return durations[len(durations) / 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup benchmark of the vsd command')
+    parser.add_argument('--runs', type=int, default=15, help='Number of runs of each scenario (default: 15)')
+    parser.add_argument('--max-overhead', type=float, default=50, help='Maximum time in ms added to an empty python process (default: 50)')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    environment = dict(os.environ, VSD_CACHE_DIRECTORY=directory)
+    environment.pop('VSD_DAEMON_SOCKET', None)
+    failures = []
+
+    try:
+        # Store the help text like a first `vsd --help` would
+        measure(['-c', RUN_VSD, '--help'], 1, environment)
+
+        baseline = measure(['-c', 'pass'], args.runs, environment)
+        print('%-20s %8.1f ms' % ('python', baseline))
+
+        for (name, arguments) in SCENARIOS:
+            duration = measure(['-c', RUN_VSD] + arguments, args.runs, environment)
+            print('%-20s %8.1f ms  (+%.1f ms)' % (name, duration, duration - baseline))
+
+            if duration - baseline > args.max_overhead:
+                failures.append('%s takes %.1f ms more than python, the maximum is %.1f ms' % (name, duration - baseline, args.max_overhead))
+
+        loaded = subprocess.check_output([sys.executable, '-c', LOADED_MODULES], env=environment).split()
+
+        if loaded:
+            failures.append('Parsing arguments imports %s' % ', '.join(loaded))
+    finally:
+        shutil.rmtree(directory)
+
+    for failure in failures:
+        print('FAILED: %s' % failure)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
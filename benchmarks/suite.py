@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, Alcatel-Lucent Inc
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the names of its contributors
+#       may be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" Benchmark suite of vsdcli against a local synthetic VSD
+
+    Starts benchmarks/mockvsd.py at every scale, then measures:
+
+    * end-to-end commands, each run in a new `vsd` process
+    * hot paths of vsdcli (rendering, filters, model loading), each
+      run in a new python process on objects built in memory
+
+    and reports latency percentiles, throughput in objects per second
+    and peak RSS of the measured process. Results can be saved as a
+    baseline and later compared to it: the suite fails when the median
+    duration or the peak RSS of a benchmark grows over the tolerance.
+
+    Usage:
+        python benchmarks/suite.py [--objects 1000 10000] [--runs 5] [--select list]
+                                   [--save baseline.json] [--compare baseline.json] [--tolerance 20]
+
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOCK_VSD = os.path.join(ROOT, 'benchmarks', 'mockvsd.py')
+RUN_VSD = 'import sys; sys.path.insert(0, %r); from vsdcli.vsd import main; main()' % ROOT
+PAGE_SIZE = 500
+ROW_POOL_SIZE = 10000
+
+sys.path.insert(0, ROOT)
+
+from mockvsd import SyntheticVSD
+
+
+def get_commands(vsd):
+    """ Returns the end-to-end benchmarks as (name, arguments, number of returned objects)
+
+    """
+    domain = vsd.get_id('domain', 0)
+    vport = vsd.get_id('vport', 0)
+
+    return [
+        ('list enterprises', ['list', 'enterprises'], vsd.counts['enterprise']),
+        ('list vports of a domain', ['list', 'vports', '--in', 'domain', domain], vsd.children['domain']),
+        ('list all vports', ['list', 'vports', '--in-all', 'domains', '--parallel', '8', '-o', 'ndjson'], vsd.counts['vport']),
+        ('list all vports as csv', ['list', 'vports', '--in-all', 'domains', '--parallel', '8', '-o', 'csv', '-x', 'ID', 'name', 'type'], vsd.counts['vport']),
+        ('count all vports', ['count', 'vports', '--in-all', 'domains', '--parallel', '8'], vsd.counts['domain']),
+        ('filter domains', ['list', 'domains', '-f', "name == 'domain1'"], 1),
+        ('show vport', ['show', 'vport', '-i', vport], 1),
+    ]
+
+
+def get_rows(objects):
+    """ Returns as many rows as the vports of a synthetic VSD of this scale
+
+        Only ROW_POOL_SIZE distinct vports are built and then repeated,
+        so that hot paths can run on millions of rows in little memory.
+
+    """
+    vsd = SyntheticVSD(objects)
+    pool = [vsd.get_object('vport', position) for position in xrange(min(ROW_POOL_SIZE, vsd.counts['vport']))]
+
+    return [pool[position % len(pool)] for position in xrange(vsd.counts['vport'])]
+
+
+def get_pages(rows):
+    """ Returns rows split in pages like the VSD sends them """
+
+    return [rows[start:start + PAGE_SIZE] for start in xrange(0, len(rows), PAGE_SIZE)]
+
+
+def render(output_format):
+    """ Returns a hot path printing all vports in a format """
+
+    def run(rows, version):
+        from vsdcli.printer import Printer
+
+        Printer.set_output_format(output_format)
+        Printer.output_pages(iter(get_pages(rows)), json=output_format != 'table')
+
+        return len(rows)
+
+    return run
+
+
+def tabulate_rows(rows, version):
+    from vsdcli.printer import Printer
+
+    Printer.output(rows)
+
+    return len(rows)
+
+
+def filter_rows(rows, version):
+    from vsdcli.snapshot import SnapshotFilter
+
+    predicate = SnapshotFilter("type == 'VM' AND (VLAN > 100 OR active == true)")
+
+    for row in rows:
+        predicate.match(row)
+
+    return len(rows)
+
+
+def load_inspector(rows, version):
+    from vsdcli.names import Names
+    from vsdcli.utils import Utils, VSDKInspector
+
+    VSDKInspector._inspectors.clear()
+    for method in (Names.get_python_name, Names.get_singular_name, Names.get_plural_name):
+        method.clear()
+
+    inspector = VSDKInspector.get_inspector(version)
+
+    for name in inspector.get_all_objects():
+        inspector.get_vsdk_class(Utils.get_singular_name(name))
+
+    return len(inspector.get_all_objects())
+
+
+# name, function called with (rows, version) returning the number of handled objects
+HOT_PATHS = [
+    ('render table', render('table')),
+    ('render json', render('json')),
+    ('render ndjson', render('ndjson')),
+    ('render csv', render('csv')),
+    ('tabulate', tabulate_rows),
+    ('filter', filter_rows),
+    ('load inspector', load_inspector),
+]
+
+
+def run_hot_path(name, objects, runs, version):
+    """ Run a hot path in the current process and print its durations as JSON
+
+        The output of the hot path is sent to /dev/null.
+
+    """
+    function = dict(HOT_PATHS)[name]
+    rows = get_rows(objects) if function is not load_inspector else None
+    result = os.fdopen(os.dup(1), 'w')
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    durations = []
+
+    for _ in xrange(runs):
+        start = time.time()
+        count = function(rows, version)
+        sys.stdout.flush()
+        durations.append(time.time() - start)
+
+    result.write(json.dumps({'durations': durations, 'objects': count}))
+    result.close()
+
+
+def measure(arguments, environment):
+    """ Run a process and returns (duration in seconds, peak RSS in bytes, output)
+
+    """
+    output = tempfile.TemporaryFile()
+
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        process = subprocess.Popen([sys.executable] + arguments, stdout=output, stderr=devnull, env=environment)
+        # wait4 gives the resource usage of this process only
+        (pid, status, usage) = os.wait4(process.pid, 0)
+        duration = time.time() - start
+
+    output.seek(0)
+
+    if status != 0:
+        raise Exception('%s failed with status %s:\n%s' % (' '.join(arguments), status, output.read()))
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+    return (duration, rss, output.read())
+
+
+def percentile(durations, percent):
+    """ Returns a percentile of sorted durations (nearest rank) """
+
+    return durations[max(0, int(math.ceil(percent / 100.0 * len(durations))) - 1)]
+
+
+def summarize(durations, objects, rss):
+    """ Returns the statistics of a benchmark """
+
+    durations = sorted(durations)
+    median = percentile(durations, 50)
+
+    return {
+        'runs': len(durations),
+        'p50': median,
+        'p90': percentile(durations, 90),
+        'p99': percentile(durations, 99),
+        'mean': sum(durations) / len(durations),
+        'throughput': objects / median if median else None,
+        'rss': rss,
+    }
+
+
+def start_server(objects, latency):
+    """ Start a synthetic VSD and returns (process, url)
+
+    """
+    with open(os.devnull, 'w') as devnull:
+        process = subprocess.Popen([sys.executable, MOCK_VSD, '--objects', str(objects), '--latency', str(latency)], stdout=subprocess.PIPE, stderr=devnull)
+
+    url = process.stdout.readline().strip()
+
+    if not url:
+        raise Exception('The synthetic VSD could not be started')
+
+    return (process, url)
+
+
+def run_scale(objects, args, selected):
+    """ Run all selected benchmarks at a scale
+
+        Returns:
+            A dictionary of statistics by benchmark name
+
+    """
+    results = dict()
+    (server, url) = start_server(objects, args.latency)
+    directory = tempfile.mkdtemp()
+    environment = dict(os.environ, VSD_API_URL=url, VSD_USERNAME='csproot', VSD_PASSWORD='csproot', VSD_ENTERPRISE='csp',
+                       VSD_API_VERSION=args.version, VSD_CACHE_DIRECTORY=directory)
+
+    for name in ('VSD_DAEMON_SOCKET', 'VSD_PROFILE', 'VSD_RESPONSE_CACHE', 'VSD_OUTPUT', 'VSD_JSON_OUTPUT'):
+        environment.pop(name, None)
+
+    try:
+        # Log in once and store the help, like a user would have done
+        measure(['-c', RUN_VSD, 'list', 'enterprises'], environment)
+
+        for (name, arguments, count) in get_commands(SyntheticVSD(objects)):
+            if not selected(name):
+                continue
+
+            durations = []
+            peak_rss = 0
+
+            for _ in xrange(args.runs):
+                (duration, rss, output) = measure(['-c', RUN_VSD] + arguments, environment)
+                durations.append(duration)
+                peak_rss = max(peak_rss, rss)
+
+            results['vsd %s' % name] = summarize(durations, count, peak_rss)
+            report(objects, 'vsd %s' % name, results['vsd %s' % name], args.baseline)
+
+        for (name, function) in HOT_PATHS:
+            if not selected(name):
+                continue
+
+            (duration, rss, output) = measure([os.path.abspath(__file__), '--hot-path', name, '--objects', str(objects), '--runs', str(args.runs), '--version', args.version], environment)
+            result = json.loads(output)
+
+            results[name] = summarize(result['durations'], result['objects'], rss)
+            report(objects, name, results[name], args.baseline)
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(directory)
+
+    return results
+
+
+def report(objects, name, result, baseline):
+    """ Print the statistics of a benchmark and their change since the baseline """
+
+    line = '%-10s %-34s %9.1f %9.1f %9.1f %12s %9.1f' % (objects, name, result['p50'] * 1000, result['p90'] * 1000, result['p99'] * 1000,
+                                                          '%.0f' % result['throughput'] if result['throughput'] else '-', result['rss'] / 1048576.0)
+    previous = baseline.get(str(objects), {}).get(name) if baseline else None
+
+    if previous:
+        line += '  %+7.1f%%  %+7.1f%%' % (change(previous['p50'], result['p50']), change(previous['rss'], result['rss']))
+
+    print(line)
+    sys.stdout.flush()
+
+
+def change(previous, current):
+    """ Returns the change in percent between two values """
+
+    return 100.0 * (current - previous) / previous if previous else 0.0
+
+
+def compare(results, baseline, tolerance):
+    """ Returns the regressions of results compared to the baseline """
+
+    failures = []
+
+    for (objects, benchmarks) in sorted(results.iteritems()):
+        for (name, result) in sorted(benchmarks.iteritems()):
+            previous = baseline.get(objects, {}).get(name)
+
+            if not previous:
+                continue
+
+            for (key, label) in (('p50', 'median duration'), ('rss', 'peak RSS')):
+                if change(previous[key], result[key]) > tolerance:
+                    failures.append('%s with %s objects: %s grew by %.1f%%, the tolerance is %.1f%%' % (name, objects, label, change(previous[key], result[key]), tolerance))
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite of vsdcli against a local synthetic VSD')
+    parser.add_argument('--objects', type=int, nargs='+', default=[1000, 10000], help='Scales to run, in number of objects (default: 1000 10000)')
+    parser.add_argument('--runs', type=int, default=5, help='Number of runs of each benchmark (default: 5)')
+    parser.add_argument('--select', help='Only run benchmarks whose name matches this regular expression')
+    parser.add_argument('--latency', type=float, default=0, help='Time in ms added by the synthetic VSD to every request (default: 0)')
+    parser.add_argument('--version', default=os.environ.get('VSD_API_VERSION', '3.2'), help='Version of the API (default: VSD_API_VERSION or 3.2)')
+    parser.add_argument('--save', help='Save the results as a baseline in this file')
+    parser.add_argument('--compare', help='Compare the results to the baseline saved in this file')
+    parser.add_argument('--tolerance', type=float, default=20, help='Maximum growth in percent of the median duration and peak RSS compared to the baseline (default: 20)')
+    parser.add_argument('--hot-path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hot_path:
+        return run_hot_path(args.hot_path, args.objects[0], args.runs, args.version)
+
+    args.baseline = None
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            args.baseline = json.load(baseline_file)['results']
+
+    pattern = re.compile(args.select) if args.select else None
+    selected = lambda name: pattern is None or pattern.search(name) is not None
+    results = dict()
+
+    print('%-10s %-34s %9s %9s %9s %12s %9s%s' % ('objects', 'benchmark', 'p50 ms', 'p90 ms', 'p99 ms', 'objects/s', 'RSS MB', '  p50 diff  RSS diff' if args.baseline else ''))
+
+    for objects in args.objects:
+        results[str(objects)] = run_scale(objects, args, selected)
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump({'runs': args.runs, 'latency': args.latency, 'results': results}, baseline_file, indent=4, sort_keys=True)
+
+    failures = compare(results, args.baseline, args.tolerance) if args.baseline else []
+
+    for failure in failures:
+        print('FAILED: %s' % failure)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, Alcatel-Lucent Inc
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the names of its contributors
+#       may be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import csv
+import json
+import os
+import sys
+
+from printer import Printer
+
+
+class BulkReader(object):
+    """ Read bulk operations from a file
+
+        Each operation is a dictionary like:
+
+            {"action": "create", "object": "subnet", "in": ["zone", "<uuid>"], "params": {"name": "Subnet"}}
+            {"action": "update", "object": "subnet", "id": "<uuid>", "params": {"description": "New"}}
+            {"action": "delete", "object": "vport", "id": "<uuid>"}
+
+        JSON lines files (and standard input) are streamed line by line.
+        CSV files use the columns action, object, id, parent and parent_id.
+        Any other non-empty column is a parameter.
+
+    """
+
+    ACTIONS = ['create', 'update', 'delete']
+    CSV_COLUMNS = ['action', 'object', 'id', 'parent', 'parent_id']
+
+    @classmethod
+    def read(cls, path):
+        """ Read operations
+
+            Args:
+                path: the path of the file or - for standard input
+
+            Returns:
+                A generator of (line_number, operation)
+
+        """
+        if path == '-':
+            return cls._read_json_lines(sys.stdin)
+
+        if not os.path.isfile(path):
+            Printer.raise_error('File %s does not exist' % path)
+
+        extension = os.path.splitext(path)[1].lower()
+
+        if extension == '.json':
+            return cls._read_json(path)
+
+        if extension in ('.yml', '.yaml'):
+            return cls._read_yaml(path)
+
+        if extension == '.csv':
+            return cls._read_csv(path)
+
+        return cls._read_json_lines(open(path))
+
+    @classmethod
+    def _read_json_lines(cls, lines):
+        """ Read one JSON operation per line """
+
+        for (line_number, line) in enumerate(lines, 1):
+            line = line.strip()
+
+            if len(line) == 0 or line.startswith('#'):
+                continue
+
+            try:
+                yield (line_number, json.loads(line))
+            except ValueError as error:
+                yield (line_number, {'error': 'Invalid JSON: %s' % error})
+
+    @classmethod
+    def _read_json(cls, path):
+        """ Read a JSON array of operations """
+
+        with open(path) as json_file:
+            try:
+                operations = json.load(json_file)
+            except ValueError as error:
+                Printer.raise_error('Invalid JSON file %s: %s' % (path, error))
+
+        for (index, operation) in enumerate(operations, 1):
+            yield (index, operation)
+
+    @classmethod
+    def _read_yaml(cls, path):
+        """ Read YAML documents or a YAML list of operations """
+
+        try:
+            import yaml
+        except ImportError as error:
+            Printer.raise_error('Please install PyYAML to read YAML files using command line `pip install pyyaml`.\n%s' % error)
+
+        index = 0
+
+        with open(path) as yaml_file:
+            for document in yaml.safe_load_all(yaml_file):
+                operations = document if isinstance(document, list) else [document]
+
+                for operation in operations:
+                    index = index + 1
+                    yield (index, operation)
+
+    @classmethod
+    def _read_csv(cls, path):
+        """ Read one operation per CSV row """
+
+        with open(path) as csv_file:
+            for (line_number, row) in enumerate(csv.DictReader(csv_file), 2):
+                operation = dict()
+                params = dict()
+
+                for (column, value) in row.iteritems():
+                    if column in cls.CSV_COLUMNS:
+                        operation[column] = value
+                    elif column and value:
+                        params[column] = value
+
+                if operation.get('parent'):
+                    operation['in'] = [operation.pop('parent'), operation.pop('parent_id', None)]
+
+                operation['params'] = params
+
+                yield (line_number, operation)
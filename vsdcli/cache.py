@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, Alcatel-Lucent Inc
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the names of its contributors
+#       may be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+def get_cache_directory():
+    """ Returns the directory where vsdcli keeps its local files
+
+        The directory can be changed with `VSD_CACHE_DIRECTORY`
+        environment variable. It is created if needed.
+
+    """
+    directory = os.path.expanduser(os.environ.get('VSD_CACHE_DIRECTORY', '~/.vsdcli'))
+
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory, 0700)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+
+    return directory
+
+
+class SessionCache(object):
+    """ On-disk cache of API keys
+
+        Entries are keyed by (api, enterprise, username, version) and
+        store the REST user returned by the VSD with its expiry date.
+        Every access holds an exclusive lock so that concurrent CLI
+        processes share a single login.
+
+    """
+
+    FILE_NAME = 'sessions.json'
+    LOCK_NAME = 'sessions.lock'
+    DEFAULT_TTL = 3600
+    EXPIRY_MARGIN = 60
+
+    def __init__(self, directory=None):
+        """ Initializes the cache
+
+            Args:
+                directory: the directory where to store the cache file
+
+        """
+        self._directory = directory if directory else get_cache_directory()
+        self._path = os.path.join(self._directory, self.FILE_NAME)
+        self._lock_path = os.path.join(self._directory, self.LOCK_NAME)
+        self._ttl = int(os.environ.get('VSD_SESSION_TTL', self.DEFAULT_TTL))
+
+    @contextmanager
+    def lock(self):
+        """ Holds the cache lock
+
+            Processes that miss the cache while another one is logging in
+            will wait and then reuse the freshly stored API key.
+
+        """
+        lock_file = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0600)
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield self
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            os.close(lock_file)
+
+    def get(self, api, enterprise, username, version, password):
+        """ Get a cached user if its API key is still valid
+
+            Args:
+                api: URL of the API endpoint
+                enterprise: name of the enterprise
+                username: name of the user
+                version: version of the API
+                password: the password given on command line
+
+            Returns:
+                The dictionary of the REST user or None
+
+        """
+        entry = self._read().get(self._get_key(api, enterprise, username, version))
+
+        if entry is None:
+            return None
+
+        if entry.get('password') != self._hash_password(password, entry.get('salt', '')):
+            return None
+
+        if entry.get('expires', 0) - self.EXPIRY_MARGIN < time.time():
+            return None
+
+        return entry.get('user')
+
+    def set(self, api, enterprise, username, version, password, user):
+        """ Store the REST user of an authenticated session
+
+            Args:
+                api: URL of the API endpoint
+                enterprise: name of the enterprise
+                username: name of the user
+                version: version of the API
+                password: the password used to log in
+                user: the REST user holding the API key
+
+        """
+        user_dict = user.to_dict()
+        user_dict.pop('password', None)
+
+        expiry = getattr(user, 'api_key_expiry', None)
+        expires = float(expiry) / 1000 if expiry else time.time() + self._ttl
+
+        salt = os.urandom(16).encode('hex')
+        entries = self._read()
+        entries[self._get_key(api, enterprise, username, version)] = {
+            'user': user_dict,
+            'expires': expires,
+            'salt': salt,
+            'password': self._hash_password(password, salt)
+        }
+        self._write(entries)
+
+    def invalidate(self, api, enterprise, username, version):
+        """ Removes an entry from the cache
+
+            Args:
+                api: URL of the API endpoint
+                enterprise: name of the enterprise
+                username: name of the user
+                version: version of the API
+
+        """
+        entries = self._read()
+
+        if entries.pop(self._get_key(api, enterprise, username, version), None) is not None:
+            self._write(entries)
+
+    def _get_key(self, api, enterprise, username, version):
+        """ Returns the key of an entry """
+
+        return '|'.join([str(api), str(enterprise), str(username), str(version)])
+
+    def _hash_password(self, password, salt):
+        """ Returns a salted hash of the password
+
+            The password itself is never written on disk. The hash only
+            ensures a cached key is not reused with other credentials.
+
+        """
+        if isinstance(password, unicode):
+            password = password.encode('utf-8')
+
+        return hashlib.sha256(salt + str(password)).hexdigest()
+
+    def _read(self):
+        """ Reads all entries """
+
+        try:
+            with open(self._path) as cache_file:
+                return json.load(cache_file)
+        except (IOError, ValueError):
+            return dict()
+
+    def _write(self, entries):
+        """ Atomically writes all entries """
+
+        (handle, path) = tempfile.mkstemp(dir=self._directory)
+        with os.fdopen(handle, 'w') as cache_file:
+            json.dump(entries, cache_file)
+
+        os.rename(path, self._path)
+
+
+class CachedResponse(object):
+    """ Response read from the response cache
+
+        It has the attributes of a bambou response used by commands.
+
+    """
+
+    def __init__(self, status_code, headers, data):
+        """ Initializes the response
+
+            Args:
+                status_code: the HTTP status code
+                headers: a dictionary of the CACHED_HEADERS of ResponseCache
+                data: the decoded body
+
+        """
+        self.status_code = status_code
+        self.headers = headers
+        self.data = data
+
+
+class ResponseCache(object):
+    """ On-disk cache of VSD responses
+
+        Responses of read requests are stored in a SQLite database
+        shared by all CLI processes. Entries are keyed by the user,
+        the method, the URL and the headers selecting the results
+        (filter, page, page size and attributes). They expire after
+        the TTL of their resource and the least recently used entries
+        are removed when the database grows over its maximum size.
+
+    """
+
+    FILE_NAME = 'responses.sqlite'
+    DEFAULT_TTL = 60
+    DEFAULT_SIZE = 64
+    KEY_HEADERS = ['X-Nuage-Filter', 'X-Nuage-Page', 'X-Nuage-PageSize', 'X-Nuage-Attributes']
+    CACHED_HEADERS = ['X-Nuage-Count', 'X-Nuage-Page', 'X-Nuage-PageSize']
+
+    def __init__(self, namespace=None, refresh=False, directory=None):
+        """ Initializes the cache
+
+            Args:
+                namespace: the api, version, enterprise and user the entries belong to
+                refresh: True to ignore stored entries and store new ones
+                directory: the directory where to store the database
+
+        """
+        self._namespace = namespace
+        self._refresh = refresh
+        self._path = os.path.join(directory if directory else get_cache_directory(), self.FILE_NAME)
+        self._connection = None
+        self._lock = threading.Lock()
+        self._default_ttl = int(os.environ.get('VSD_RESPONSE_CACHE_TTL', self.DEFAULT_TTL))
+        self._ttls = self._parse_ttls(os.environ.get('VSD_RESPONSE_CACHE_TTLS', ''))
+        self._max_size = int(os.environ.get('VSD_RESPONSE_CACHE_SIZE', self.DEFAULT_SIZE)) * 1024 * 1024
+
+    def get(self, resource, request):
+        """ Get the stored response of a request
+
+            Args:
+                resource: the resource name of the requested objects
+                request: the request about to be sent
+
+            Returns:
+                A CachedResponse or None
+
+        """
+        if self._refresh:
+            return None
+
+        key = self._get_key(request)
+
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute('SELECT status, headers, data FROM responses WHERE key = ? AND expires > ?', (key, time.time())).fetchone()
+
+            if row is None:
+                return None
+
+            connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time.time(), key))
+            connection.commit()
+
+        return CachedResponse(row[0], json.loads(row[1]), json.loads(row[2]))
+
+    def set(self, resource, request, response):
+        """ Store the response of a request
+
+            Args:
+                resource: the resource name of the requested objects
+                request: the sent request
+                response: the response received from the VSD
+
+        """
+        ttl = self._ttls.get(resource, self._default_ttl)
+
+        if ttl <= 0:
+            return
+
+        headers = dict((name, response.headers[name]) for name in self.CACHED_HEADERS if name in response.headers)
+        data = json.dumps(response.data)
+        now = time.time()
+
+        with self._lock:
+            connection = self._connect()
+            connection.execute('INSERT OR REPLACE INTO responses (key, resource, status, headers, data, size, expires, accessed) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (self._get_key(request), resource, response.status_code, json.dumps(headers), data, len(data), now + ttl, now))
+            connection.commit()
+            self._evict(connection)
+
+    def invalidate(self, resources):
+        """ Remove all entries of resources, for every user
+
+            Args:
+                resources: a list of resource names
+
+        """
+        if not os.path.exists(self._path):
+            return
+
+        with self._lock:
+            connection = self._connect()
+            connection.executemany('DELETE FROM responses WHERE resource = ?', [(resource, ) for resource in resources])
+            connection.commit()
+
+    def _evict(self, connection):
+        """ Remove expired entries then least recently used ones until the size is under the maximum """
+
+        connection.execute('DELETE FROM responses WHERE expires <= ?', (time.time(), ))
+        size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+        while size > self._max_size:
+            connection.execute('DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT 100)')
+            size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+        connection.commit()
+
+    def _connect(self):
+        """ Returns the connection to the database, creating it if needed """
+
+        if self._connection is None:
+            import sqlite3
+            self._connection = sqlite3.connect(self._path, timeout=30, check_same_thread=False)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, resource TEXT, status INTEGER, headers TEXT, data TEXT, size INTEGER, expires REAL, accessed REAL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS responses_resource ON responses (resource)')
+            self._connection.commit()
+
+        return self._connection
+
+    def _get_key(self, request):
+        """ Returns the key of a request """
+
+        headers = request.headers
+        parts = [self._namespace, request.method, request.url] + [headers.get(name, '') for name in self.KEY_HEADERS]
+        parts = [part.encode('utf-8') if isinstance(part, unicode) else str(part) for part in parts]
+
+        return hashlib.sha1('|'.join(parts)).hexdigest()
+
+    def _parse_ttls(self, value):
+        """ Returns TTLs by resource from a string like `enterprises=300,vports=10` """
+
+        ttls = dict()
+
+        for item in value.split(','):
+            if '=' in item:
+                (resource, ttl) = item.split('=', 1)
+                ttls[resource.strip()] = int(ttl)
+
+        return ttls
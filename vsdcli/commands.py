@@ -25,9 +25,25 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import json
 import os
-
+import Queue
+import sys
+import time
+
+from bambou import NURESTRequest
+from bambou.exceptions import BambouHTTPError
+from bulk import BulkReader
+from cache import ResponseCache
+from collections import deque, OrderedDict
+from email.utils import mktime_tz, parsedate_tz
+from multiprocessing.pool import ThreadPool
 from printer import Printer
+from profiler import Profiler
+from query import Query, QueryError
+from scheduler import RateLimiter
+from snapshot import Snapshot
+from transport import Transport
 from utils import Utils, VSDKInspector
 
 
@@ -35,13 +51,23 @@ class VSDCommand(object):
     """ VSD CLI commands
 
     """
+
+    DEFAULT_PAGE_SIZE = 500
+
+    _response_cache = None
+
     @classmethod
     def execute(cls, args):
         """ Execute CLI command """
 
-        func = getattr(cls, args.command)
-        cls._check_arguments(args)
-        func(args)
+        command = args.command
+        func = getattr(cls, command)
+
+        try:
+            cls._check_arguments(args)
+            func(args)
+        finally:
+            Profiler.stop(command)
 
     ### Commands
 
@@ -50,11 +76,17 @@ class VSDCommand(object):
         """ List all objects
 
         """
-        inspector = VSDKInspector(args.version)
+        if args.from_snapshot:
+            return cls._list_snapshot(args)
+
+        query = cls._get_query(args)
+        fields = query.get_fields() if query else args.fields
+        inspector = VSDKInspector.get_inspector(args.version)
         name = Utils.get_singular_name(args.name)
         instance = inspector.get_vsdk_instance(name)
         session = inspector.get_user_session(args)
-        parent = inspector.get_vsdk_parent(args.parent_infos, session.user)
+        parents = cls._get_parents(inspector, args, session)
+        parent = parents[0] if parents else inspector.get_vsdk_instance(Utils.get_singular_name(args.in_all))
 
         classname = instance.__class__.__name__[2:]
         plural_classname = Utils.get_plural_name(classname)
@@ -73,25 +105,42 @@ class VSDCommand(object):
 
             Printer.raise_error(error_message)
 
-        (fetcher, parent, objects) = fetcher.fetch(filter=args.filter)
+        page_size = args.page_size
 
-        if objects is None:
-            Printer.raise_error('Could not retrieve. Activate verbose mode for more information')
+        if args.in_all or len(parents) > 1:
+            targets = [(target.id, target) for target in parents]
+            cls._output_targets(args, session, targets, cls._list_target, (fetcher_name, args.filter, page_size, fields, args.typed), instance.rest_resource_name, query)
+            return
+
+        (count, pages) = cls._fetch_pages(fetcher, filter=args.filter, page_size=page_size, session=session, parallel=args.parallel, fields=fields, typed=args.typed)
 
         if not args.json:
-            Printer.success('%s %s have been retrieved' % (len(objects), instance.rest_resource_name))
-        Printer.output(objects, fields=args.fields, json=args.json)
+            Printer.success('%s %s have been retrieved' % (count, instance.rest_resource_name))
+
+        if query:
+            pages = cls._run_query(query, pages)
+
+        Printer.output_pages(pages, fields=None if query and query.is_aggregated else args.fields, json=args.json, widths=inspector.get_column_widths(name))
 
     @classmethod
     def count(cls, args):
         """ Count all objects
 
         """
-        inspector = VSDKInspector(args.version)
+        # Counting by group needs the objects, only their grouped fields are fetched
+        if args.group_by or args.aggregates:
+            return cls.list(args)
+
+        if args.from_snapshot:
+            return cls._count_snapshot(args)
+
+        query = cls._get_query(args)
+        inspector = VSDKInspector.get_inspector(args.version)
         name = Utils.get_singular_name(args.name)
         instance = inspector.get_vsdk_instance(name)
         session = inspector.get_user_session(args)
-        parent = inspector.get_vsdk_parent(args.parent_infos, session.user)
+        parents = cls._get_parents(inspector, args, session)
+        parent = parents[0] if parents else inspector.get_vsdk_instance(Utils.get_singular_name(args.in_all))
 
         classname = instance.__class__.__name__[2:]
         plural_classname = Utils.get_plural_name(classname)
@@ -110,7 +159,19 @@ class VSDCommand(object):
 
             Printer.raise_error(error_message)
 
-        (fetcher, parent, count) = fetcher.count(filter=args.filter)
+        if args.in_all or len(parents) > 1:
+            targets = [(target.id, target) for target in parents]
+            cls._output_targets(args, session, targets, cls._count_target, (fetcher_name, args.filter, instance.rest_resource_name, args.typed), instance.rest_resource_name, query, counted=True)
+            return
+
+        if query:
+            cls._raise_single_count_sort()
+
+        try:
+            count = cls._count(fetcher, filter=args.filter, typed=args.typed)
+        except Exception, e:
+            VSDKInspector.check_parent_error(parent, e)
+            Printer.raise_error('Could not count %s. Activate verbose mode for more information:\n%s' % (instance.rest_resource_name, e))
 
         if not args.json:
             Printer.success('%s %s have been retrieved' % (count, instance.rest_resource_name))
@@ -123,11 +184,26 @@ class VSDCommand(object):
             Args:
                 uuid: Identifier of the object to show
         """
+        if args.from_snapshot:
+            return cls._show_snapshot(args)
 
-        inspector = VSDKInspector(args.version)
+        inspector = VSDKInspector.get_inspector(args.version)
         session = inspector.get_user_session(args)
 
         name = Utils.get_singular_name(args.name)
+
+        if len(args.id) > 1:
+            targets = []
+
+            for id in args.id:
+                target = inspector.get_vsdk_instance(name)
+                target.id = session.user.id if id == 'me' else id
+                targets.append((id, target))
+
+            cls._output_targets(args, session, targets, cls._show_target, (args.fields, args.typed), name)
+            return
+
+        args.id = args.id[0]
         instance = inspector.get_vsdk_instance(name)
 
         instance.id = args.id
@@ -136,20 +212,20 @@ class VSDCommand(object):
             instance.id = session.user.id
 
         try:
-            (instance, connection) = instance.fetch()
+            data = cls._fetch_object(instance, typed=args.typed)
         except Exception, e:
             Printer.raise_error('Could not find %s with id `%s`. Activate verbose mode for more information:\n%s' % (name, args.id, e))
 
         if not args.json:
             Printer.success('%s with id %s has been retrieved' % (name, args.id))
-        Printer.output(instance, fields=args.fields, json=args.json, headers={'Attribute', 'Value'})
+        Printer.output_object(data, fields=args.fields, json=args.json, headers={'Attribute', 'Value'})
 
     @classmethod
     def create(cls, args):
         """ Create an object
 
         """
-        inspector = VSDKInspector(args.version)
+        inspector = VSDKInspector.get_inspector(args.version)
         name = Utils.get_singular_name(args.name)
         instance = inspector.get_vsdk_instance(name)
         session = inspector.get_user_session(args)
@@ -161,8 +237,11 @@ class VSDCommand(object):
         try:
             (instance, connection) = parent.create_child(instance)
         except Exception, e:
+            VSDKInspector.check_parent_error(parent, e)
             Printer.raise_error('Cannot create %s:\n%s' % (name, e))
 
+        cls._invalidate_cache(inspector, [name])
+
         if not args.json:
             Printer.success('%s has been created with ID=%s' % (name, instance.id))
         Printer.output(instance, json=args.json)
@@ -173,7 +252,7 @@ class VSDCommand(object):
 
 
         """
-        inspector = VSDKInspector(args.version)
+        inspector = VSDKInspector.get_inspector(args.version)
         name = Utils.get_singular_name(args.name)
         instance = inspector.get_vsdk_instance(name)
         instance.id = args.id
@@ -186,15 +265,19 @@ class VSDCommand(object):
         except Exception, e:
             Printer.raise_error('Could not find %s with id `%s`. Activate verbose mode for more information:\n%s' % (name, args.id, e))
 
-        cls._fill_instance_with_attributes(instance, attributes)
-
         try:
-            (instance, connection) = instance.save()
+            changes = cls._update_instance(instance, attributes)
         except Exception, e:
             Printer.raise_error('Cannot update %s:\n%s' % (name, e))
 
+        if changes:
+            cls._invalidate_cache(inspector, [name])
+
         if not args.json:
-            Printer.success('%s with ID=%s has been updated' % (name, instance.id))
+            if changes:
+                Printer.success('%s with ID=%s has been updated' % (name, instance.id))
+            else:
+                Printer.success('%s with ID=%s is already up to date' % (name, instance.id))
         Printer.output(instance, json=args.json)
 
     @classmethod
@@ -202,20 +285,18 @@ class VSDCommand(object):
         """ Assign one or multiple new objects
             Already assigned objects will be ignored.
         """
-        def internal_method(object_class, ids, current_objects):
-            """ Returns final objects and nb_affected_objects """
+        def internal_method(ids, current_ids):
+            """ Returns final ids and nb_affected_objects """
 
-            nb_affected_objects = 0
-            final_objects = current_objects
-            known_ids = [current_object.id for current_object in current_objects]
+            final_ids = list(current_ids)
+            known_ids = set(current_ids)
 
             for id in ids:
                 if id not in known_ids:
-                    nb_affected_objects = nb_affected_objects + 1
-                    obj = object_class(id=id)
-                    final_objects.append(obj)
+                    known_ids.add(id)
+                    final_ids.append(id)
 
-            return (final_objects, nb_affected_objects)
+            return (final_ids, len(final_ids) - len(current_ids))
 
         Printer.success('%s %s with IDs=%s have been assigned to %s with ID=%s' % cls._internal_assign(args, method=internal_method))
 
@@ -225,17 +306,13 @@ class VSDCommand(object):
             Already unassigned objects will be ignored.
         """
 
-        def internal_method(object_class, ids, current_objects):
-            """ Returns final objects and nb_affected_objects """
-            nb_affected_objects = 0
-            final_objects = []
-            for current_object in current_objects:
-                if current_object.id in ids:
-                    nb_affected_objects = nb_affected_objects + 1
-                else:
-                    final_objects.append(current_object)
+        def internal_method(ids, current_ids):
+            """ Returns final ids and nb_affected_objects """
+
+            removed_ids = set(ids)
+            final_ids = [current_id for current_id in current_ids if current_id not in removed_ids]
 
-            return (final_objects, nb_affected_objects)
+            return (final_ids, len(current_ids) - len(final_ids))
 
         Printer.success('%s %s with IDs=%s have been unassigned from %s with ID=%s' % cls._internal_assign(args, method=internal_method))
 
@@ -244,19 +321,15 @@ class VSDCommand(object):
         """ Change all assignations
             Previous assignations will be removed
         """
-        def internal_method(object_class, ids, current_objects):
-            """ Returns final objects and nb_affected_objects """
+        def internal_method(ids, current_ids):
+            """ Returns final ids and nb_affected_objects """
 
-            nb_affected_objects = 0
-            final_objects = []
+            final_ids = []
 
             if ids:
-                for id in ids:
-                    nb_affected_objects = nb_affected_objects + 1
-                    obj = object_class(id=id)
-                    final_objects.append(obj)
+                final_ids = list(OrderedDict.fromkeys(ids))
 
-            return (final_objects, nb_affected_objects)
+            return (final_ids, len(final_ids))
 
         Printer.success('%s %s with IDs=%s have been reassigned to %s with ID=%s' % cls._internal_assign(args, method=internal_method))
 
@@ -264,14 +337,16 @@ class VSDCommand(object):
     def _internal_assign(cls, args, method):
         """ Execute method to list final assignation
 
+            Only identifiers of currently assigned objects are fetched.
+            Nothing is sent when the assignation does not change.
+
             Returns:
                 (nb_affected_objects, assigned_objects_name, assigned_objects_ids, parent_name, parent_id)
         """
-        inspector = VSDKInspector(args.version)
+        inspector = VSDKInspector.get_inspector(args.version)
 
         name = Utils.get_singular_name(args.name)
         object_class = inspector.get_vsdk_class(name)
-        object_type = object_class()
 
         session = inspector.get_user_session(args)
         resource = inspector.get_vsdk_parent(args.parent_infos, session.user)
@@ -283,27 +358,34 @@ class VSDCommand(object):
         try:
             fetcher = getattr(resource, fetcher_name)
         except:
-
-            if resource.rest_name == 'me':
-                resource_name = 'Root'
+            resource_name = 'Root' if resource.rest_name == 'me' else resource.rest_name
 
             error_message = '%s failed to found children %s.' % (resource_name, fetcher_name)
             Printer.raise_error(error_message)
 
-        (fetcher, resource, current_objects) = fetcher.fetch()
+        page_size = args.page_size
 
-        if current_objects is None:
-            current_objects = []
+        try:
+            current_ids = cls._fetch_ids(resource, object_class, page_size=page_size)
+        except Exception, e:
+            VSDKInspector.check_parent_error(resource, e)
+            Printer.raise_error('Could not retrieve assigned %s. Activate verbose mode for more information:\n%s' % (args.name, e))
+
+        if args.ids is None:
+            args.ids = []
+
+        (final_ids, nb_affected_objects) = method(args.ids, current_ids)
 
-        (final_objects, nb_affected_objects) = method(object_class, args.ids, current_objects)
+        if set(final_ids) == set(current_ids):
+            return (0, args.name, args.ids, resource.rest_name, resource.id)
 
         try:
-            (references, connection) = resource.assign(final_objects, object_class)
+            cls._send_request(resource, NURESTRequest(method='PUT', url=resource.get_resource_url_for_child_type(object_class), data=final_ids))
         except Exception, e:
+            VSDKInspector.check_parent_error(resource, e)
             Printer.raise_error('Cannot assign %s:\n%s' % (name, e))
 
-        if args.ids is None:
-            args.ids = []
+        cls._invalidate_cache(inspector, [name])
 
         return (nb_affected_objects, args.name, args.ids, resource.rest_name, resource.id)
 
@@ -313,7 +395,7 @@ class VSDCommand(object):
 
 
         """
-        inspector = VSDKInspector(args.version)
+        inspector = VSDKInspector.get_inspector(args.version)
         name = Utils.get_singular_name(args.name)
         instance = inspector.get_vsdk_instance(name)
         instance.id = args.id
@@ -325,35 +407,336 @@ class VSDCommand(object):
         except Exception, e:
             Printer.raise_error('Could not delete %s with id `%s`. Activate verbose mode for more information:\n%s' % (name, args.id, e))
 
+        cls._invalidate_cache(inspector, [name], cascade=True)
+
         Printer.success('%s with ID=%s has been deleted' % (name, instance.id))
 
+    @classmethod
+    def apply(cls, args):
+        """ Apply create, update and delete operations read from a file
+
+            Operations are run over a single session by a pool of
+            `concurrency` threads. The file is streamed and at most
+            `concurrency` operations are in flight (twice as many with
+            --continue-on-error). The result of every operation is
+            printed as soon as it is known.
+
+        """
+        inspector = VSDKInspector.get_inspector(args.version)
+        session = inspector.get_user_session(args)
+        operations = BulkReader.read(args.file)
+        limiter = RateLimiter(args.rate)
+        concurrency = max(1, args.concurrency)
+        window = concurrency * 2 if args.continue_on_error else concurrency
+
+        # bambou keeps the current session per thread
+        pool = ThreadPool(processes=concurrency, initializer=session.start)
+        results = Queue.Queue()
+        report = {'succeeded': 0, 'failed': 0, 'pending': 0}
+        written_names = set()
+        deleted_names = set()
+
+        def handle_result(result):
+            (line_number, succeeded, message, identifier) = result
+
+            report['succeeded' if succeeded else 'failed'] += 1
+
+            if args.json:
+                print(json.dumps({'line': line_number, 'success': succeeded, 'id': identifier, 'message': message}))
+            elif succeeded:
+                Printer.success('Line %s: %s' % (line_number, message))
+            else:
+                Printer.error('Line %s: %s' % (line_number, message))
+
+        def wait_for_result():
+            handle_result(results.get())
+            report['pending'] -= 1
+
+        try:
+            for (line_number, operation) in operations:
+                while not results.empty() or report['pending'] >= window:
+                    wait_for_result()
+
+                if report['failed'] > 0 and not args.continue_on_error:
+                    break
+
+                try:
+                    task = cls._prepare_operation(inspector, session.user, operation)
+                except ValueError as error:
+                    handle_result((line_number, False, str(error), None))
+                    continue
+
+                (deleted_names if task[0] == 'delete' else written_names).add(task[1])
+
+                limiter.acquire()
+                pool.apply_async(cls._apply_operation, (line_number, ) + task, callback=results.put)
+                report['pending'] += 1
+
+            while report['pending'] > 0:
+                wait_for_result()
+        finally:
+            pool.terminate()
+            cls._invalidate_cache(inspector, written_names)
+            cls._invalidate_cache(inspector, deleted_names, cascade=True)
+
+        if not args.json:
+            Printer.info('%s operations succeeded, %s failed' % (report['succeeded'], report['failed']))
+
+        if report['failed'] > 0:
+            sys.exit(1)
+
+    @classmethod
+    def snapshot(cls, args):
+        """ Save an object and all its descendants in a local file
+
+            Descendants are found by following children of the VSDK
+            model. Every kind of children of every parent is fetched
+            by a pool of `--parallel` threads, level by level. Each
+            object is crawled once even when it is found under several
+            parents.
+
+            With --incremental, an existing snapshot is refreshed: only
+            children updated since the last sync are fetched, and
+            children are counted to detect deletions. Identifiers of
+            children are listed only when counts differ.
+
+        """
+        inspector = VSDKInspector.get_inspector(args.version)
+        name = Utils.get_singular_name(args.name)
+        instance = inspector.get_vsdk_instance(name)
+        session = inspector.get_user_session(args)
+        instance.id = session.user.id if args.id == 'me' else args.id
+        page_size = args.page_size
+        excluded = set(args.exclude if args.exclude is not None else Snapshot.EXCLUDED_CHILDREN)
+        incremental = args.incremental and os.path.isfile(args.file)
+        start = time.time()
+
+        # A snapshot must reflect the VSD, not the response cache
+        cls._response_cache = None
+
+        try:
+            response = cls._send_request(instance, NURESTRequest(method='GET', url=instance.get_resource_url()))
+            root = response.data[0]
+        except Exception, e:
+            Printer.raise_error('Could not find %s with id `%s`. Activate verbose mode for more information:\n%s' % (name, args.id, e))
+
+        # Next syncs fetch objects updated since the crawl started, whatever the dates of crawled objects
+        sync_date = cls._get_server_date(response, start)
+
+        if incremental:
+            try:
+                snapshot = Snapshot.update(args.file)
+            except IOError, e:
+                Printer.raise_error(str(e))
+
+            if snapshot.get_info('root') != [name, instance.id]:
+                Printer.raise_error('Snapshot %s has not been taken from %s with ID=%s' % (args.file, name, instance.id))
+
+            since = snapshot.get_sync_date()
+            skipped = set([tuple(failure) for failure in snapshot.get_info('failures', [])])
+            incomplete = set([tuple(pair) for pair in snapshot.get_info('incomplete', [])])
+        else:
+            snapshot = Snapshot.create(args.file)
+            snapshot.set_info('root', [name, instance.id])
+            snapshot.set_info('version', args.version)
+            snapshot.set_info('api', args.api)
+            since = None
+            skipped = set()
+            incomplete = set()
+
+        snapshot.add(name, Snapshot.ROOT, [root])
+
+        (fetched, failures, succeeded, incomplete) = cls._crawl_snapshot(inspector, session, snapshot, (name, instance.id), since, excluded, skipped, incomplete, page_size, args.parallel)
+        removed = snapshot.remove_orphans() if incremental else 0
+        count = snapshot.count_objects()
+
+        # Kinds of children that are never allowed or never exist are skipped by next incremental syncs
+        denied = set([kind for (kind, errors) in failures.iteritems() if all([cls._is_denied(error) for error in errors])]) - succeeded
+        snapshot.set_info('failures', sorted(skipped | denied))
+
+        # Children that could not be fetched are counted by the next sync, and changes made meanwhile fetched again
+        snapshot.set_info('incomplete', sorted(incomplete))
+
+        if not incomplete:
+            snapshot.set_sync_date(sync_date)
+
+        snapshot.save()
+
+        for ((parent_name, child_name), errors) in failures.iteritems():
+            Printer.warn('Could not fetch %s of %s %s: %s' % (inspector.get_resource_name(child_name), len(errors), inspector.get_resource_name(parent_name), errors[0]))
+
+        if incomplete:
+            Printer.warn('The sync date of %s has not been changed, the next incremental sync fetches again objects updated since the previous one' % args.file)
+
+        if incremental:
+            Printer.success('%s updated objects have been fetched and %s deleted objects removed, %s objects are saved in %s in %.1fs' % (fetched, removed, count, args.file, time.time() - start))
+        else:
+            Printer.success('%s objects have been saved in %s in %.1fs' % (count, args.file, time.time() - start))
+
+    @classmethod
+    def _is_denied(cls, error):
+        """ Returns True if an error tells that children will never be fetched, unlike timeouts or server errors
+
+        """
+        return isinstance(error, BambouHTTPError) and error.connection.response.status_code in Snapshot.SKIPPED_STATUSES
+
+    @classmethod
+    def _get_server_date(cls, response, default):
+        """ Returns the Date header of a response in milliseconds
+
+            Args:
+                response: a response of the VSD
+                default: the timestamp in seconds used when the date is missing or invalid
+
+        """
+        date = parsedate_tz(response.headers.get('Date') or '')
+
+        return int((mktime_tz(date) if date else default) * 1000)
+
+    @classmethod
+    def _crawl_snapshot(cls, inspector, session, snapshot, root, since, excluded, skipped, incomplete, page_size, parallel):
+        """ Save descendants of an object in a snapshot level by level
+
+            Children of objects that were not in the snapshot are all
+            fetched. Children of saved objects are fetched only when
+            updated after `since`, then counted when some of them are
+            saved: when the count differs from the saved one, their
+            identifiers are listed to remove deleted children and fetch
+            missing ones. Kinds of children with no saved children are
+            not counted, as nothing can have been deleted and new ones
+            are updated after `since`, unless they could not be fetched
+            by the previous sync.
+
+            Args:
+                root: the (rest_name, ID) of the crawled object
+                since: the lastUpdatedDate after which children are fetched, None to fetch all of them
+                excluded: the rest names or resource names of children that are not saved
+                skipped: the (parent rest name, child rest name) that are not fetched
+                incomplete: the (parent ID, child rest name) that could not be fetched by the previous sync
+
+            Returns:
+                A tuple (number of fetched objects, list of errors by (parent rest name, child rest name), set of fetched (parent rest name, child rest name), set of (parent ID, child rest name) not fetched because of errors other than denied kinds)
+
+        """
+        known_ids = snapshot.get_ids() if since is not None else set()
+        visited = set([root[1]])
+        failures = OrderedDict()
+        succeeded = set()
+        not_fetched = set()
+        fetched = 0
+        level = [root]
+
+        def run(task):
+            (action, parent_name, parent_id, child_name) = task
+
+            try:
+                parent = inspector.get_vsdk_instance(parent_name)
+                parent.id = parent_id
+                object_class = inspector.get_vsdk_class(child_name)
+
+                if action == 'fetch':
+                    return (task, cls._fetch_children(parent, object_class, page_size), None, None, None)
+
+                if action == 'update':
+                    return (task, cls._fetch_children(parent, object_class, page_size, filter='lastUpdatedDate > %s' % since), None, None, None)
+
+                if action == 'sync':
+                    children = cls._fetch_children(parent, object_class, page_size, filter='lastUpdatedDate > %s' % since)
+                    return (task, children, cls._count(parent.fetcher_for_rest_name(child_name), filter=None), None, None)
+
+                return (task, None, None, cls._fetch_ids(parent, object_class, page_size), None)
+
+            except (Exception, SystemExit), e:
+                return (task, None, None, None, e)
+
+        # bambou keeps the current session per thread
+        pool = ThreadPool(processes=max(1, parallel), initializer=session.start)
+
+        try:
+            while level:
+                tasks = []
+
+                for (parent_name, parent_id) in level:
+                    saved_names = set([child_name for (child_name, child_id) in snapshot.get_relations(parent_id)]) if parent_id in known_ids else None
+
+                    for child_name in inspector.get_children_rest_names(parent_name):
+                        if not inspector.has_object(child_name) or (parent_name, child_name) in skipped or child_name in excluded or inspector.get_resource_name(child_name) in excluded:
+                            continue
+
+                        if saved_names is None:
+                            action = 'fetch'
+                        elif child_name in saved_names or (parent_id, child_name) in incomplete:
+                            action = 'sync'
+                        else:
+                            action = 'update'
+
+                        tasks.append((action, parent_name, parent_id, child_name))
+
+                while tasks:
+                    next_tasks = []
+
+                    for ((action, parent_name, parent_id, child_name), children, count, ids, error) in pool.imap_unordered(run, tasks):
+                        if error is not None:
+                            failures.setdefault((parent_name, child_name), []).append(error)
+
+                            if not cls._is_denied(error):
+                                not_fetched.add((parent_id, child_name))
+                            continue
+
+                        succeeded.add((parent_name, child_name))
+
+                        if action == 'list':
+                            ids = set(ids)
+                            snapshot.remove_children(parent_id, child_name, keep=ids)
+
+                            if not ids.issubset(snapshot.get_children_ids(parent_id, child_name)):
+                                next_tasks.append(('fetch', parent_name, parent_id, child_name))
+                            continue
+
+                        snapshot.add(child_name, parent_id, children)
+                        fetched += len(children)
+
+                        if action == 'sync' and count != len(snapshot.get_children_ids(parent_id, child_name)):
+                            next_tasks.append(('list', parent_name, parent_id, child_name))
+
+                    tasks = next_tasks
+
+                next_level = []
+
+                for (parent_name, parent_id) in level:
+                    for (child_name, child_id) in snapshot.get_relations(parent_id):
+                        if child_id not in visited:
+                            visited.add(child_id)
+                            next_level.append((child_name, child_id))
+
+                level = next_level
+        finally:
+            pool.terminate()
+
+        return (fetched, failures, succeeded, not_fetched)
+
     @classmethod
     def objects(cls, args):
         """ List all objects of the VSD
 
         """
-        inspector = VSDKInspector(args.version)
+        inspector = VSDKInspector.get_inspector(args.version)
         objects = []
 
-        if args.parent:
-            name = Utils.get_singular_name(args.parent)
-            instance = inspector.get_vsdk_instance(name)
+        if args.path_to:
+            return cls._objects_path(inspector, args)
 
-            objects = [Utils.get_plural_name(name) for name in instance.children_rest_names]
-        else:
-            objects = inspector.get_all_objects()
+        if args.parent:
+            objects = inspector.get_children_rest_names(Utils.get_singular_name(args.parent))
 
         if args.child:
-            child = Utils.get_singular_name(args.child)
-            parents = []
-            for name in objects:
-                singular_name = Utils.get_singular_name(name)
-                instance = inspector.get_vsdk_instance(singular_name)
-
-                if child in instance.children_rest_names:
-                    parents.append(name)
+            parents = inspector.get_parent_rest_names(Utils.get_singular_name(args.child))
+            objects = list(set(objects) & set(parents)) if args.parent else parents
 
-            objects = parents
+        if args.parent or args.child:
+            objects = [Utils.get_plural_name(name) for name in objects]
+        else:
+            objects = inspector.get_all_objects()
 
         if args.filter:
             objects = [name for name in objects if args.filter in name]
@@ -366,6 +749,775 @@ class VSDCommand(object):
 
     ### General methods
 
+    @classmethod
+    def _objects_path(cls, inspector, args):
+        """ Print how to reach an object from the parent given by -p (default: root)
+
+        """
+        from_name = Utils.get_singular_name(args.parent) if args.parent else 'me'
+        to_name = Utils.get_singular_name(args.path_to)
+        path = inspector.find_path(from_name, to_name)
+
+        if path is None:
+            Printer.raise_error('%s cannot be reached from %s' % (args.path_to, args.parent if args.parent else 'Root'))
+
+        objects = [Utils.get_plural_name(name) for name in path if name != 'me']
+
+        if not args.json:
+            Printer.success('%s can be reached in %s steps.' % (args.path_to, len(path) - 1))
+        Printer.output(objects, json=args.json, headers={'Name'})
+
+    @classmethod
+    def _list_snapshot(cls, args):
+        """ List objects saved in a snapshot
+
+        """
+        query = cls._get_query(args)
+        (snapshot, inspector) = cls._open_snapshot(args)
+        name = Utils.get_singular_name(args.name)
+        resource_name = inspector.get_resource_name(name)
+        parent_ids = cls._get_snapshot_parents(snapshot, args)
+
+        try:
+            pages = [snapshot.get_children(parent_id, name, filter=args.filter) for parent_id in parent_ids]
+        except ValueError, e:
+            Printer.raise_error('Invalid filter: %s' % e)
+
+        count = sum([len(page) for page in pages])
+
+        fields = query.get_fields() if query else args.fields
+
+        if args.in_all or len(parent_ids) > 1:
+            rows = (cls._get_snapshot_rows(parent_id, page, fields) for (parent_id, page) in zip(parent_ids, pages))
+            Printer.output_pages(cls._run_query(query, rows) if query else rows, json=args.json)
+
+            if not args.json:
+                Printer.success('%s %s have been retrieved from %s targets of snapshot %s' % (count, resource_name, len(parent_ids), snapshot.path))
+            return
+
+        if not args.json:
+            Printer.success('%s %s have been retrieved from snapshot %s' % (count, resource_name, snapshot.path))
+
+        rows = iter([[Printer._object_to_dict(obj, fields) for obj in pages[0]]])
+        Printer.output_pages(cls._run_query(query, rows) if query else rows, fields=None if query and query.is_aggregated else args.fields, json=args.json, widths=inspector.get_column_widths(name))
+
+    @classmethod
+    def _count_snapshot(cls, args):
+        """ Count objects saved in a snapshot
+
+        """
+        query = cls._get_query(args)
+        (snapshot, inspector) = cls._open_snapshot(args)
+        name = Utils.get_singular_name(args.name)
+        resource_name = inspector.get_resource_name(name)
+        parent_ids = cls._get_snapshot_parents(snapshot, args)
+
+        try:
+            counts = [(parent_id, len(snapshot.get_children(parent_id, name, filter=args.filter))) for parent_id in parent_ids]
+        except ValueError, e:
+            Printer.raise_error('Invalid filter: %s' % e)
+
+        if args.in_all or len(parent_ids) > 1:
+            rows = iter([[OrderedDict([('target', parent_id), (resource_name, count)]) for (parent_id, count) in counts]])
+            Printer.output_pages(cls._run_query(query, rows) if query else rows, json=args.json)
+
+            if not args.json:
+                Printer.success('%s %s have been counted in %s targets of snapshot %s' % (sum([count for (parent_id, count) in counts]), resource_name, len(parent_ids), snapshot.path))
+            return
+
+        if query:
+            cls._raise_single_count_sort()
+
+        if not args.json:
+            Printer.success('%s %s have been retrieved from snapshot %s' % (counts[0][1], resource_name, snapshot.path))
+        Printer.output({resource_name: counts[0][1]}, fields=[resource_name], json=args.json)
+
+    @classmethod
+    def _show_snapshot(cls, args):
+        """ Show objects saved in a snapshot
+
+        """
+        (snapshot, inspector) = cls._open_snapshot(args)
+        name = Utils.get_singular_name(args.name)
+        objects = snapshot.get_objects(name, ids=args.id)
+
+        for (id, obj) in zip(args.id, objects):
+            if obj is None:
+                Printer.raise_error('Could not find %s with id `%s` in snapshot %s' % (name, id, snapshot.path))
+
+        if len(args.id) > 1:
+            Printer.output_pages(iter([cls._get_snapshot_rows(id, [obj], args.fields) for (id, obj) in zip(args.id, objects)]), json=args.json)
+            return
+
+        if not args.json:
+            Printer.success('%s with id %s has been retrieved from snapshot %s' % (name, args.id[0], snapshot.path))
+        Printer.output_object(objects[0], fields=args.fields, json=args.json, headers={'Attribute', 'Value'})
+
+    @classmethod
+    def _open_snapshot(cls, args):
+        """ Open the snapshot given by `--from-snapshot`
+
+            The version of the snapshot is used when no version is given.
+
+            Returns:
+                A tuple (snapshot, inspector)
+
+        """
+        try:
+            snapshot = Snapshot.open(args.from_snapshot)
+        except IOError, e:
+            Printer.raise_error(str(e))
+
+        args.version = args.version if args.version else snapshot.get_info('version')
+
+        return (snapshot, VSDKInspector.get_inspector(args.version))
+
+    @classmethod
+    def _get_snapshot_parents(cls, snapshot, args):
+        """ Get identifiers of the parents targeted by `--in` or `--in-all` in a snapshot
+
+            Returns:
+                A list of identifiers. Snapshot.ROOT when no parent is given.
+
+        """
+        if args.in_all:
+            try:
+                return [obj['ID'] for obj in snapshot.get_objects(Utils.get_singular_name(args.in_all), filter=args.in_filter)]
+            except ValueError, e:
+                Printer.raise_error('Invalid filter: %s' % e)
+
+        if args.parent_infos is None:
+            return [Snapshot.ROOT]
+
+        if len(args.parent_infos) < 2:
+            Printer.raise_error('Please specify the parent using `--in PARENT_NAME UUID [UUID ...]` syntax')
+
+        return args.parent_infos[1:]
+
+    @classmethod
+    def _get_snapshot_rows(cls, label, objects, fields):
+        """ Returns rows of objects with a target field holding a label
+
+        """
+        rows = [cls._get_row(obj, fields) for obj in objects]
+
+        for row in rows:
+            row['target'] = label
+
+        return rows
+
+    @classmethod
+    @Profiler.profiled('parents')
+    def _get_parents(cls, inspector, args, session):
+        """ Get the parents targeted by `--in` or `--in-all`
+
+            Parents are not fetched. With `--in-all`, the identifiers
+            of all parents matching `--in-filter` are fetched.
+
+            Returns:
+                A list of parents. The user when no parent is given.
+
+        """
+        if args.in_all:
+            name = Utils.get_singular_name(args.in_all)
+            object_class = inspector.get_vsdk_class(name)
+            page_size = args.page_size
+
+            try:
+                ids = cls._fetch_ids(session.user, object_class, page_size=page_size, filter=args.in_filter)
+            except Exception, e:
+                Printer.raise_error('Could not retrieve %s. Activate verbose mode for more information:\n%s' % (args.in_all, e))
+
+            return [inspector.get_vsdk_parent([name, id], session.user) for id in ids]
+
+        if args.parent_infos is None:
+            return [session.user]
+
+        if len(args.parent_infos) < 2:
+            Printer.raise_error('Please specify the parent using `--in PARENT_NAME UUID [UUID ...]` syntax')
+
+        name = args.parent_infos[0]
+
+        return [inspector.get_vsdk_parent([name, uuid], session.user) for uuid in args.parent_infos[1:]]
+
+    @classmethod
+    def _output_targets(cls, args, session, targets, method, arguments, resource_name, query=None, counted=False):
+        """ Run a method on several targets and print all results
+
+            Targets are handled by a pool of `--parallel` threads
+            sharing the session. Results are printed in order of
+            targets, as soon as they are available, with a `target`
+            field holding the label of their target.
+
+            Args:
+                targets: a list of (label, target)
+                method: the method called with a target and arguments in worker threads
+                arguments: a tuple of additional arguments
+                resource_name: the name of retrieved objects for the summary
+                query: the Query run over the results or None
+                counted: True if results are counts of objects in their `resource_name` field
+
+        """
+        report = {'objects': 0, 'errors': []}
+
+        def pages():
+            for (label, rows, error) in cls._run_targets(session, targets, method, arguments, args.parallel):
+                if error:
+                    report['errors'].append('%s: %s' % (label, error))
+                    continue
+
+                for row in rows:
+                    row['target'] = label
+
+                report['objects'] += sum([row[resource_name] for row in rows]) if counted else len(rows)
+                yield rows
+
+        Printer.output_pages(cls._run_query(query, pages()) if query else pages(), json=args.json)
+
+        for error in report['errors']:
+            Printer.error(error)
+
+        if not args.json:
+            Printer.success('%s %s have been %s %s targets' % (report['objects'], resource_name, 'counted in' if counted else 'retrieved from', len(targets)))
+
+        if report['errors']:
+            sys.exit(1)
+
+    @classmethod
+    def _run_targets(cls, session, targets, method, arguments, parallel):
+        """ Run a method on targets with a pool of threads
+
+            Returns:
+                A generator of (label, rows, error) in order of targets
+
+        """
+        def run(target):
+            (label, obj) = target
+
+            try:
+                return (label, method(obj, *arguments), None)
+            except (Exception, SystemExit), e:
+                return (label, None, VSDKInspector.get_parent_error(obj, e) or str(e))
+
+        # bambou keeps the current session per thread
+        pool = ThreadPool(processes=max(1, parallel), initializer=session.start)
+
+        try:
+            for result in pool.imap(run, targets):
+                yield result
+        finally:
+            pool.terminate()
+
+    @classmethod
+    def _list_target(cls, parent, fetcher_name, filter, page_size, fields, typed):
+        """ Fetch all children of a parent
+
+            Returns:
+                A list of dictionaries
+
+        """
+        fetcher = getattr(parent, fetcher_name)
+        rows = []
+        page = 0
+
+        while True:
+            (objects, count) = cls._fetch_page(fetcher, filter=filter, page=page, page_size=page_size, fields=fields, typed=typed)
+            rows.extend([cls._get_row(obj, fields) for obj in objects])
+
+            page = page + 1
+            if len(objects) < page_size or (count is not None and page * page_size >= count):
+                return rows
+
+    @classmethod
+    def _count_target(cls, parent, fetcher_name, filter, resource_name, typed):
+        """ Count children of a parent
+
+            Returns:
+                A list with one dictionary
+
+        """
+        count = cls._count(getattr(parent, fetcher_name), filter=filter, typed=typed)
+
+        return [OrderedDict([('target', None), (resource_name, count)])]
+
+    @classmethod
+    def _show_target(cls, instance, fields, typed):
+        """ Fetch one object
+
+            Returns:
+                A list with one dictionary
+
+        """
+        return [cls._get_row(cls._fetch_object(instance, typed=typed), fields)]
+
+    @classmethod
+    def _get_row(cls, obj, fields):
+        """ Returns an ordered dictionary of an object starting with a target field
+
+        """
+        row = OrderedDict([('target', None)])
+        row.update(Printer._object_to_dict(obj, fields))
+
+        return row
+
+    @classmethod
+    def _fetch_pages(cls, fetcher, filter, page_size, session=None, parallel=1, fields=None, typed=False):
+        """ Fetch objects page by page
+
+            The first page is fetched right away to get the total count.
+            Next pages are fetched while the returned generator is consumed.
+            When parallel is greater than 1, up to `parallel` pages are
+            fetched at the same time by a pool of threads. Pages are
+            still returned in order and at most `parallel` pages are
+            kept in memory.
+
+            Args:
+                fetcher: the fetcher to use
+                filter: the filter predicate
+                page_size: the number of objects per page
+                session: the session to use in worker threads
+                parallel: the maximum number of concurrent requests
+                fields: the attributes to fetch (see `_fetch_page`)
+                typed: True to get VSDK objects instead of dictionaries
+
+            Returns:
+                A tuple (total_count, pages) where pages is a generator of lists of objects
+
+        """
+        (objects, total_count) = cls._get_page(fetcher, filter=filter, page=0, page_size=page_size, fields=fields, typed=typed)
+        has_total_count = total_count is not None
+
+        if not has_total_count:
+            total_count = len(objects)
+
+        def pages():
+            if len(objects) == 0:
+                return
+
+            yield objects
+
+            if len(objects) < page_size or page_size >= total_count:
+                return
+
+            if parallel > 1 and has_total_count:
+                page_count = (total_count + page_size - 1) // page_size
+                for page_objects in cls._fetch_pages_in_parallel(fetcher, filter, page_size, page_count, session, parallel, fields, typed):
+                    yield page_objects
+                return
+
+            page = 1
+            while True:
+                (page_objects, count) = cls._get_page(fetcher, filter=filter, page=page, page_size=page_size, fields=fields, typed=typed)
+
+                if len(page_objects) == 0:
+                    break
+
+                yield page_objects
+
+                page = page + 1
+                if len(page_objects) < page_size or page * page_size >= total_count:
+                    break
+
+        return (total_count, pages())
+
+    @classmethod
+    def _fetch_pages_in_parallel(cls, fetcher, filter, page_size, page_count, session, parallel, fields=None, typed=False):
+        """ Fetch pages 1 to page_count with a bounded pool of threads
+
+            Returns:
+                A generator of lists of objects in page order
+
+        """
+        # bambou keeps the current session per thread
+        pool = ThreadPool(processes=parallel, initializer=session.start)
+        pending = deque()
+        next_page = 1
+
+        try:
+            while next_page < page_count or len(pending) > 0:
+                while next_page < page_count and len(pending) < parallel:
+                    pending.append((next_page, pool.apply_async(cls._fetch_page, (fetcher, filter, next_page, page_size, fields, typed))))
+                    next_page = next_page + 1
+
+                (page, result) = pending.popleft()
+
+                try:
+                    (page_objects, count) = result.get()
+                except Exception, e:
+                    Printer.raise_error('Could not retrieve page %s. Activate verbose mode for more information:\n%s' % (page, e))
+
+                if len(page_objects) > 0:
+                    yield page_objects
+        finally:
+            pool.terminate()
+
+    @classmethod
+    def _get_page(cls, fetcher, filter, page, page_size, fields=None, typed=False):
+        """ Fetch one page of objects or print an error
+
+            Returns:
+                A tuple (objects, total_count). Total count is None if unknown.
+
+        """
+        try:
+            return cls._fetch_page(fetcher, filter=filter, page=page, page_size=page_size, fields=fields, typed=typed)
+        except Exception, e:
+            VSDKInspector.check_parent_error(fetcher.parent_object, e)
+            Printer.raise_error('Could not retrieve page %s. Activate verbose mode for more information:\n%s' % (page, e))
+
+    @classmethod
+    def _fetch_page(cls, fetcher, filter, page, page_size, fields=None, typed=False):
+        """ Fetch one page of objects
+
+            Unless typed is True, the page is returned as the dictionaries
+            sent by the VSD (see `_fetch_raw_page`). When fields are given,
+            only these attributes are requested, even if typed is True.
+
+            Otherwise, a new fetcher is used for every page so that
+            concurrent requests do not share their connection. Page and
+            page size are sent as strings, otherwise the first page (0)
+            would be ignored by the fetcher.
+
+            Returns:
+                A tuple (objects, total_count). Total count is None if unknown.
+
+        """
+        projection = fields if fields and 'ALL' not in fields else None
+
+        if projection or not typed:
+            return cls._fetch_raw_page(fetcher.parent_object, fetcher.managed_class(), filter=filter, page=page, page_size=page_size, fields=projection)
+
+        page_fetcher = fetcher.__class__()
+        page_fetcher.parent_object = fetcher.parent_object
+
+        (page_fetcher, parent, objects) = page_fetcher.fetch(filter=filter, page=str(page), page_size=str(page_size), commit=False)
+        response = page_fetcher.current_connection.response
+
+        if objects is None and response.status_code != 204:
+            raise Exception('Unexpected HTTP status %s' % response.status_code)
+
+        count = response.headers.get('X-Nuage-Count')
+
+        return (objects if objects else [], int(count) if count else None)
+
+    @classmethod
+    def _prepare_operation(cls, inspector, user, operation):
+        """ Check an operation and build its objects
+
+            Nothing is sent to the VSD. The parent of a created object
+            is referenced by its identifier and is not fetched.
+
+            Args:
+                inspector: the VSDK inspector
+                user: the user of the session
+                operation: the operation read from the file
+
+            Returns:
+                A tuple (action, name, instance, parent, attributes)
+
+            Raises:
+                ValueError if the operation is not valid
+
+        """
+        if not isinstance(operation, dict):
+            raise ValueError('Operation must be an object')
+
+        if 'error' in operation:
+            raise ValueError(operation['error'])
+
+        action = operation.get('action')
+        if action not in BulkReader.ACTIONS:
+            raise ValueError('Action must be one of %s' % ', '.join(BulkReader.ACTIONS))
+
+        name = Utils.get_singular_name(str(operation.get('object', '')))
+        if not inspector.has_object(name):
+            raise ValueError('Unknown object named %s' % name)
+
+        instance = inspector.get_vsdk_instance(name)
+        attributes = cls._get_attributes(operation.get('params') or dict(), on_error=cls._raise_value_error)
+        parent = None
+
+        if action == 'create':
+            cls._fill_instance_with_attributes(instance, attributes, on_error=cls._raise_value_error)
+            parent = user
+            parent_infos = operation.get('in')
+
+            if parent_infos:
+                if len(parent_infos) != 2 or not parent_infos[1]:
+                    raise ValueError('Parent must be given as [parent_name, parent_uuid]')
+
+                parent_name = Utils.get_singular_name(str(parent_infos[0]))
+                if not inspector.has_object(parent_name):
+                    raise ValueError('Unknown object named %s' % parent_name)
+
+                parent = inspector.get_vsdk_instance(parent_name)
+                parent.id = parent_infos[1]
+
+        elif not operation.get('id'):
+            raise ValueError('Please provide the id of the %s to %s' % (name, action))
+
+        else:
+            instance.id = operation['id']
+
+        return (action, name, instance, parent, attributes)
+
+    @classmethod
+    def _apply_operation(cls, line_number, action, name, instance, parent, attributes):
+        """ Send one operation to the VSD
+
+            This method is run by worker threads and never raises.
+
+            Returns:
+                A tuple (line_number, succeeded, message, id)
+
+        """
+        try:
+            if action == 'create':
+                parent.create_child(instance, commit=False)
+                return (line_number, True, '%s has been created with ID=%s' % (name, instance.id), instance.id)
+
+            if action == 'update':
+                instance.fetch()
+
+                if not cls._update_instance(instance, attributes, on_error=cls._raise_value_error):
+                    return (line_number, True, '%s with ID=%s is already up to date' % (name, instance.id), instance.id)
+
+                return (line_number, True, '%s with ID=%s has been updated' % (name, instance.id), instance.id)
+
+            instance.delete()
+            return (line_number, True, '%s with ID=%s has been deleted' % (name, instance.id), instance.id)
+
+        except (Exception, SystemExit), e:
+            return (line_number, False, 'Cannot %s %s with ID=%s: %s' % (action, name, instance.id, e), instance.id)
+
+    @classmethod
+    def _update_instance(cls, instance, attributes, on_error=None):
+        """ Update a fetched instance with attributes
+
+            Only attributes whose value differ from the fetched ones
+            are sent to the VSD. Nothing is sent when all attributes
+            already have the requested values.
+
+            Args:
+                instance: the fetched instance
+                attributes: the dictionary of attributes
+                on_error: the method called with the error message (default: Printer.raise_error)
+
+            Returns:
+                A dictionary of the changed attributes by remote name
+
+        """
+        current_values = instance.to_dict()
+
+        cls._fill_instance_with_attributes(instance, attributes, on_error=on_error)
+
+        new_values = instance.to_dict()
+        changes = dict((remote_name, value) for (remote_name, value) in new_values.iteritems() if current_values.get(remote_name) != value)
+
+        if changes:
+            request = NURESTRequest(method='PUT', url=instance.get_resource_url(), data=changes)
+            instance._did_retrieve(instance.send_request(request=request))
+
+        return changes
+
+    @classmethod
+    def _raise_value_error(cls, message):
+        """ Raise a ValueError instead of exiting
+
+        """
+        raise ValueError(message)
+
+    @classmethod
+    def _fetch_ids(cls, parent, object_class, page_size, filter=None):
+        """ Fetch identifiers of all children of a parent page by page
+
+            Only the ID attribute is requested and responses are read
+            as plain dictionaries without creating VSDK objects.
+
+            Args:
+                parent: the parent object
+                object_class: the VSDK class of the children
+                page_size: the number of objects per page
+                filter: the filter predicate
+
+            Returns:
+                A list of identifiers
+
+        """
+        return [row['ID'] for row in cls._fetch_children(parent, object_class, page_size, filter=filter, fields=['ID'])]
+
+    @classmethod
+    def _fetch_children(cls, parent, object_class, page_size, filter=None, fields=None):
+        """ Fetch all children of a parent page by page as dictionaries
+
+            Args:
+                parent: the parent object
+                object_class: the VSDK class of the children
+                page_size: the number of objects per page
+                filter: the filter predicate
+                fields: the attributes to fetch
+
+            Returns:
+                A list of dictionaries
+
+        """
+        children = []
+        page = 0
+
+        while True:
+            (rows, count) = cls._fetch_raw_page(parent, object_class, filter=filter, page=page, page_size=page_size, fields=fields)
+            children.extend(rows)
+
+            page = page + 1
+            if len(rows) < page_size or (count is not None and page * page_size >= count):
+                return children
+
+    @classmethod
+    def _fetch_raw_page(cls, parent, object_class, filter, page, page_size, fields=None):
+        """ Fetch one page of children as dictionaries
+
+            The request is sent with the session headers and the decoded
+            response is returned as is, without creating VSDK objects.
+
+            When fields are given, they are sent to the VSD as a projection.
+            Whether the VSD applies it or not, only these attributes are
+            taken from the response.
+
+            Args:
+                parent: the parent object
+                object_class: the VSDK class of the children
+                filter: the filter predicate
+                page: the number of the page
+                page_size: the number of objects per page
+                fields: the remote names of the attributes or None for all attributes
+
+            Returns:
+                A tuple (rows, total_count) where rows are dictionaries. Total count is None if unknown.
+
+        """
+        request = NURESTRequest(method='GET', url=parent.get_resource_url_for_child_type(object_class))
+        request.set_header('X-Nuage-Page', str(page))
+        request.set_header('X-Nuage-PageSize', str(page_size))
+
+        if fields:
+            request.set_header('X-Nuage-Attributes', ', '.join(fields))
+
+        if filter:
+            request.set_header('X-Nuage-Filter', filter)
+
+        response = cls._send_request(parent, request, resource=object_class.rest_resource_name)
+        count = response.headers.get('X-Nuage-Count')
+        rows = []
+
+        if response.status_code == 200 and response.data and fields:
+            rows = [OrderedDict([(field, obj[field]) for field in fields if field in obj]) for obj in response.data]
+        elif response.status_code == 200 and response.data:
+            rows = response.data
+
+        return (rows, int(count) if count else None)
+
+    @classmethod
+    def _fetch_object(cls, instance, typed=False):
+        """ Fetch an object by its ID
+
+            Args:
+                instance: the VSDK object holding the ID
+                typed: True to return the fetched VSDK object instead of the dictionary sent by the VSD
+
+        """
+        if typed:
+            (instance, connection) = instance.fetch()
+            return instance
+
+        response = cls._send_request(instance, NURESTRequest(method='GET', url=instance.get_resource_url()), resource=instance.rest_resource_name)
+
+        return response.data[0]
+
+    @classmethod
+    def _count(cls, fetcher, filter, typed=False):
+        """ Count children of the parent of a fetcher
+
+            Unless typed is True, the HEAD request is sent directly
+            with the session headers.
+
+            Returns:
+                The number of children
+
+        """
+        if typed:
+            (fetcher, parent, count) = fetcher.count(filter=filter)
+            return count
+
+        request = NURESTRequest(method='HEAD', url=fetcher.parent_object.get_resource_url_for_child_type(fetcher.managed_class()))
+
+        if filter:
+            request.set_header('X-Nuage-Filter', filter)
+
+        count = cls._send_request(fetcher.parent_object, request, resource=fetcher.managed_class().rest_resource_name).headers.get('X-Nuage-Count')
+
+        return int(count) if count else 0
+
+    @classmethod
+    def _send_request(cls, parent, request, resource=None):
+        """ Send a request and return its response
+
+            When the response cache is enabled, responses of read
+            requests are taken from and stored in the cache.
+
+            Args:
+                parent: the object sending the request
+                request: the request
+                resource: the resource name of the requested objects
+
+            Raises:
+                BambouHTTPError if the VSD returns an error
+
+        """
+        cache = cls._response_cache if resource and request.method in ('GET', 'HEAD') else None
+
+        if cache:
+            response = cache.get(resource, request)
+
+            if response is not None:
+                return response
+
+        connection = parent.send_request(request=request)
+
+        if connection.response.status_code >= 400:
+            raise BambouHTTPError(connection=connection)
+
+        if cache:
+            cache.set(resource, request, connection.response)
+
+        return connection.response
+
+    @classmethod
+    def _invalidate_cache(cls, inspector, names, cascade=False):
+        """ Remove cached responses of written objects
+
+            Args:
+                inspector: the VSDK inspector
+                names: the names of written objects
+                cascade: True to remove responses of their descendants too (after a deletion)
+
+        """
+        names = set(names)
+        resources = set()
+
+        while names:
+            name = names.pop()
+
+            if not inspector.has_object(name) or inspector.get_resource_name(name) in resources:
+                continue
+
+            resources.add(inspector.get_resource_name(name))
+
+            if cascade:
+                names.update(inspector.get_children_rest_names(name))
+
+        if resources:
+            ResponseCache().invalidate(resources)
+
     @classmethod
     def _check_arguments(cls, args):
         """ Check arguments and environment variables
@@ -378,41 +1530,125 @@ class VSDCommand(object):
         args.version = args.version if args.version else os.environ.get('VSD_API_VERSION', None)
         args.enterprise = args.enterprise if args.enterprise else os.environ.get('VSD_ENTERPRISE', None)
         args.json = True if os.environ.get('VSD_JSON_OUTPUT') == 'True' else args.json
+        args.output = args.output if args.output else os.environ.get('VSD_OUTPUT', 'json' if args.json else 'table')
+        args.session_cache = False if os.environ.get('VSD_SESSION_CACHE') == 'False' else args.session_cache
+        args.page_size = getattr(args, 'page_size', None) or cls._get_page_size()
+
+        if getattr(args, 'in_filter', None) and not getattr(args, 'in_all', None):
+            Printer.raise_error('Option --in-filter selects the parents of --in-all and cannot be used without it')
+
+        # Snapshots are read without connecting to the VSD
+        if not getattr(args, 'from_snapshot', None):
+            if args.username is None or len(args.username) == 0:
+                Printer.raise_error('Please provide a username using option --username or VSD_USERNAME environment variable')
+
+            if args.password is None or len(args.password) == 0:
+                Printer.raise_error('Please provide a password using option --password or VSD_PASSWORD environment variable')
+
+            if args.api is None or len(args.api) == 0:
+                Printer.raise_error('Please provide an API URL using option --api or VSD_API_URL environment variable')
 
-        if args.username is None or len(args.username) == 0:
-            Printer.raise_error('Please provide a username using option --username or VSD_USERNAME environment variable')
+            if args.enterprise is None or len(args.enterprise) == 0:
+                Printer.raise_error('Please provide an enterprise using option --enterprise or VSD_ENTERPRISE environment variable')
 
-        if args.password is None or len(args.password) == 0:
-            Printer.raise_error('Please provide a password using option --password or VSD_PASSWORD environment variable')
+        if args.output not in Printer.OUTPUT_FORMATS:
+            Printer.raise_error('Output format %s is not one of %s' % (args.output, ', '.join(Printer.OUTPUT_FORMATS)))
 
-        if args.api is None or len(args.api) == 0:
-            Printer.raise_error('Please provide an API URL using option --api or VSD_API_URL environment variable')
+        args.json = args.output != 'table'
+        Printer.set_output_format(args.output, compact=args.compact)
 
-        if args.enterprise is None or len(args.enterprise) == 0:
-            Printer.raise_error('Please provide an enterprise using option --enterprise or VSD_ENTERPRISE environment variable')
+        try:
+            Transport.configure(pool_size=max(getattr(args, 'parallel', 1), getattr(args, 'concurrency', 1)))
+        except ValueError, e:
+            Printer.raise_error(str(e))
+
+        if args.response_cache is None:
+            args.response_cache = os.environ.get('VSD_RESPONSE_CACHE') == 'True' or args.refresh
+
+        namespace = '|'.join([str(args.api), str(args.version), str(args.enterprise), str(args.username)])
+        cls._response_cache = ResponseCache(namespace, refresh=args.refresh) if args.response_cache else None
 
         setattr(args, "name", getattr(args, args.command, None))
         del(args.command)
 
     @classmethod
-    def _get_attributes(cls, params):
+    def _run_query(cls, query, pages):
+        """ Run a query over pages or print its error
+
+            Returns:
+                A generator of lists of dictionaries
+
+        """
+        try:
+            for page in query.run(pages):
+                yield page
+        except QueryError, e:
+            Printer.raise_error(str(e))
+
+    @classmethod
+    def _raise_single_count_sort(cls):
+        """ Print the error of `--sort` given to count a single parent
+
+        """
+        Printer.raise_error('A single count cannot be sorted. Use --in-all or several IDs with --in')
+
+    @classmethod
+    def _get_page_size(cls):
+        """ Returns the page size set by `VSD_PAGE_SIZE` or DEFAULT_PAGE_SIZE
+
+        """
+        value = os.environ.get('VSD_PAGE_SIZE')
+
+        if not value:
+            return cls.DEFAULT_PAGE_SIZE
+
+        try:
+            page_size = int(value)
+        except ValueError:
+            page_size = 0
+
+        if page_size < 1:
+            Printer.raise_error('VSD_PAGE_SIZE must be a positive number instead of %s' % value)
+
+        return page_size
+
+    @classmethod
+    def _get_query(cls, args):
+        """ Returns the Query of `--sort`, `--group-by` and `--agg` options or None
+
+        """
+        try:
+            return Query.from_arguments(args)
+        except ValueError, e:
+            Printer.raise_error(str(e))
+
+    @classmethod
+    def _get_attributes(cls, params, on_error=None):
         """ Transforms a list of Key=Value
             to a dictionary of attributes
 
             Args:
-                params: list of Key=Value
+                params: list of Key=Value or a dictionary
+                on_error: the method called with the error message (default: Printer.raise_error)
 
             Returns:
                 A dict
 
         """
+        on_error = on_error if on_error else Printer.raise_error
         attributes = dict()
 
+        if isinstance(params, dict):
+            for (key, value) in params.iteritems():
+                attributes[Utils.get_python_name(key)] = value
+
+            return attributes
+
         for param in params:
             infos = param.split('=', 1)
 
             if len(infos) != 2:
-                Printer.raise_error('Parameter %s is not in key=value format' % param)
+                on_error('Parameter %s is not in key=value format' % param)
 
             attribute_name = Utils.get_python_name(infos[0])
             attributes[attribute_name] = infos[1]
@@ -420,28 +1656,31 @@ class VSDCommand(object):
         return attributes
 
     @classmethod
-    def _fill_instance_with_attributes(cls, instance, attributes):
+    def _fill_instance_with_attributes(cls, instance, attributes, on_error=None):
         """ Fill the given instance with attributes
 
             Args:
                 instance: the instance to fill
                 attributes: the dictionary of attributes
+                on_error: the method called with the error message (default: Printer.raise_error)
 
             Returns:
                 The instance filled or throw an exception
 
         """
+        on_error = on_error if on_error else Printer.raise_error
+
         for attribute_name, attribute_value in attributes.iteritems():
 
             attribute = instance.get_attribute_infos(attribute_name)
             if attribute is None:
-                Printer.raise_error('Attribute %s could not be found in %s' % (attribute_name, instance.rest_name))
+                on_error('Attribute %s could not be found in %s' % (attribute_name, instance.rest_name))
 
             try:
                 value = attribute.attribute_type(attribute_value)
                 setattr(instance, attribute_name, value)
             except Exception, e:
-                Printer.raise_error('Attribute %s could not be set with value %s\n%s' % (attribute_name, attribute_value, e))
+                on_error('Attribute %s could not be set with value %s\n%s' % (attribute_name, attribute_value, e))
 
         # TODO-CS: Remove validation when we will have all attribute information from Swagger...
         # if not instance.validate():
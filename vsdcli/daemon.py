@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, Alcatel-Lucent Inc
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the names of its contributors
+#       may be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import cmd
+import json
+import os
+import shlex
+import signal
+import socket
+import SocketServer
+import sys
+
+from contextlib import contextmanager
+from StringIO import StringIO
+
+EXIT_MARKER = '\0'
+ENVIRONMENT_PREFIX = 'VSD_'
+
+
+@contextmanager
+def environment(environ):
+    """ Temporarily replace VSD environment variables
+
+        Args:
+            environ: a dictionary of VSD environment variables
+
+    """
+    saved_environ = dict((key, value) for key, value in os.environ.iteritems() if key.startswith(ENVIRONMENT_PREFIX))
+
+    for key in saved_environ:
+        del os.environ[key]
+
+    os.environ.update(environ)
+
+    try:
+        yield
+    finally:
+        for key in [key for key in os.environ if key.startswith(ENVIRONMENT_PREFIX)]:
+            del os.environ[key]
+
+        os.environ.update(saved_environ)
+
+
+@contextmanager
+def working_directory(path):
+    """ Temporarily change the working directory
+
+        Args:
+            path: the working directory or None to keep the current one
+
+    """
+    saved_path = os.getcwd()
+
+    if path:
+        os.chdir(path)
+
+    try:
+        yield
+    finally:
+        os.chdir(saved_path)
+
+
+def run_command(argv, cwd=None):
+    """ Run a command line in the current process
+
+        Inspectors and sessions are kept between two commands.
+
+        Args:
+            argv: the list of arguments
+            cwd: the working directory of the command (default: the current one)
+
+        Returns:
+            The exit code of the command
+
+    """
+    from commands import VSDCommand
+    from printer import Printer
+    from vsd import get_parser, start_profiler
+
+    try:
+        args = get_parser().parse_args(argv)
+
+        if args.command in ('shell', 'daemon'):
+            Printer.raise_error('Command %s cannot be run from a shell or a daemon' % args.command)
+
+        start_profiler(args)
+
+        with working_directory(cwd):
+            VSDCommand.execute(args)
+
+    except SystemExit as error:
+        if error.code is None or isinstance(error.code, int):
+            return error.code or 0
+        return 1
+
+    except Exception as error:
+        Printer.error('Unexpected error: %s' % error)
+        return 1
+
+    return 0
+
+
+def preload():
+    """ Load the VSDK of the version set in the environment
+
+    """
+    from utils import VSDKInspector
+
+    inspector = VSDKInspector.get_inspector(os.environ.get('VSD_API_VERSION', None))
+    inspector.get_vsdk_class('me')
+
+
+class VSDShell(cmd.Cmd):
+    """ Interactive shell
+
+        Commands are the same as the CLI ones without the `vsd` prefix.
+
+    """
+
+    intro = 'VSD interactive shell. Type `help` for usage and `exit` to quit.'
+    prompt = 'vsd> '
+
+    def preloop(self):
+        """ Load the VSDK before the first command """
+
+        preload()
+
+    def default(self, line):
+        """ Run a CLI command """
+
+        try:
+            argv = shlex.split(line)
+        except ValueError as error:
+            from printer import Printer
+            Printer.error(error)
+            return
+
+        try:
+            run_command(argv)
+        except KeyboardInterrupt:
+            print('')
+
+    def emptyline(self):
+        """ Do not repeat the last command """
+
+        pass
+
+    def completenames(self, text, *ignored):
+        """ Complete command names """
+
+        import argparse
+        from vsd import get_parser
+
+        names = []
+        for action in get_parser()._actions:
+            if isinstance(action, argparse._SubParsersAction):
+                names.extend([name for name in action.choices if name.startswith(text)])
+
+        return names
+
+    def do_help(self, line):
+        """ Print the help of the CLI or of a command """
+
+        run_command(shlex.split(line) + ['--help'])
+
+    def do_exit(self, line):
+        """ Exit the shell """
+
+        return True
+
+    do_quit = do_exit
+
+    def do_EOF(self, line):
+        """ Exit the shell """
+
+        print('')
+        return True
+
+
+class VSDRequestHandler(SocketServer.StreamRequestHandler):
+    """ Run a command forwarded by a client
+
+        The client sends a JSON line with its arguments, environment and
+        working directory, so that relative paths are resolved like in
+        the client.
+        The output of the command is streamed back, followed by the
+        exit marker, the exit code on its own line and what the command
+        wrote on its error output (like the --profile report), so that
+        the client prints it apart from the output.
+
+    """
+
+    wbufsize = 65536
+
+    def handle(self):
+        """ Handle a client request """
+
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+
+        (stdout, stderr) = (sys.stdout, sys.stderr)
+        sys.stdout = self.wfile
+        sys.stderr = StringIO()
+
+        try:
+            with environment(request.get('environ', dict())):
+                exit_code = run_command(request.get('argv', []), request.get('cwd', None))
+
+            self.wfile.write('%s%d\n%s' % (EXIT_MARKER, exit_code, sys.stderr.getvalue()))
+        except socket.error:
+            pass
+        finally:
+            (sys.stdout, sys.stderr) = (stdout, stderr)
+
+
+class VSDDaemon(SocketServer.UnixStreamServer):
+    """ Local server running commands forwarded by vsd clients
+
+        Commands are run one at a time, sharing the same VSDK,
+        sessions and HTTP connections.
+
+    """
+
+    @classmethod
+    def get_socket_path(cls, socket_path=None):
+        """ Returns the path of the daemon socket
+
+        """
+        if socket_path:
+            return socket_path
+
+        if 'VSD_DAEMON_SOCKET' in os.environ:
+            return os.environ['VSD_DAEMON_SOCKET']
+
+        from cache import get_cache_directory
+        return os.path.join(get_cache_directory(), 'daemon.sock')
+
+    @classmethod
+    def serve(cls, socket_path=None):
+        """ Serve forever on a Unix socket
+
+            Args:
+                socket_path: the path of the socket
+
+        """
+        from printer import Printer
+
+        socket_path = cls.get_socket_path(socket_path)
+
+        if os.path.exists(socket_path):
+            if VSDClient.is_listening(socket_path):
+                Printer.raise_error('A daemon is already listening on %s' % socket_path)
+            os.unlink(socket_path)
+
+        umask = os.umask(0077)
+        try:
+            server = cls(socket_path, VSDRequestHandler)
+        finally:
+            os.umask(umask)
+
+        preload()
+        Printer.success('Daemon is listening. Use `export VSD_DAEMON_SOCKET=%s` to forward commands to it' % socket_path)
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.unlink(socket_path)
+
+
+class VSDClient(object):
+    """ Thin client forwarding command lines to a daemon
+
+    """
+
+    BUFFER_SIZE = 65536
+
+    @classmethod
+    def is_listening(cls, socket_path):
+        """ Returns True if a daemon listens on the socket """
+
+        client = cls._connect(socket_path)
+
+        if client is None:
+            return False
+
+        client.close()
+        return True
+
+    @classmethod
+    def forward(cls, socket_path, argv):
+        """ Forward a command line to the daemon
+
+            Args:
+                socket_path: the path of the daemon socket
+                argv: the list of arguments
+
+            Returns:
+                The exit code of the command or None if no daemon is listening
+
+        """
+        client = cls._connect(socket_path)
+
+        if client is None:
+            return None
+
+        environ = dict((key, value) for key, value in os.environ.iteritems() if key.startswith(ENVIRONMENT_PREFIX) and key != 'VSD_DAEMON_SOCKET')
+        client.sendall(json.dumps({'argv': argv, 'environ': environ, 'cwd': os.getcwd()}) + '\n')
+
+        trailer = None
+
+        while True:
+            data = client.recv(cls.BUFFER_SIZE)
+
+            if not data:
+                break
+
+            if trailer is not None:
+                trailer += data
+                continue
+
+            position = data.find(EXIT_MARKER)
+
+            if position < 0:
+                sys.stdout.write(data)
+            else:
+                sys.stdout.write(data[:position])
+                trailer = data[position + 1:]
+
+        sys.stdout.flush()
+        client.close()
+
+        (exit_code, separator, error_output) = (trailer or '').partition('\n')
+        sys.stderr.write(error_output)
+
+        try:
+            return int(exit_code)
+        except ValueError:
+            return 1
+
+    @classmethod
+    def _connect(cls, socket_path):
+        """ Returns a socket connected to the daemon or None """
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            client.connect(socket_path)
+        except socket.error:
+            client.close()
+            return None
+
+        return client
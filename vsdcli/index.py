@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, Alcatel-Lucent Inc
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the names of its contributors
+#       may be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+import imp
+import importlib
+import json
+import os
+import tempfile
+
+from collections import deque
+from cache import get_cache_directory
+
+
+class VSDKIndex(object):
+    """ Precomputed index of VSDK objects
+
+        The index holds for each rest_name its class name, resource name,
+        children and parents rest names and attributes. It is generated
+        once per installed VSDK package and stored on disk, so that
+        commands can resolve object names and relations without
+        importing the whole VSDK.
+
+    """
+
+    IGNORED_NAMES = ['NUVSDSession', 'NURESTModelController']
+    FORMAT_VERSION = 2
+
+    def __init__(self, package_name, objects):
+        """ Initializes the index
+
+            Args:
+                package_name: the name of the indexed VSDK package
+                objects: a dictionary of object information by rest_name
+
+        """
+        self._package_name = package_name
+        self._objects = objects
+
+    @classmethod
+    def find_package(cls, package_name):
+        """ Find a VSDK package without importing it
+
+            Args:
+                package_name: the name of the package (ex: vspk.vsdk.v3_2)
+
+            Returns:
+                The path of the package or None if it is not installed
+
+        """
+        (parent_name, _, name) = package_name.rpartition('.')
+
+        try:
+            path = importlib.import_module(parent_name).__path__ if parent_name else None
+            (package_file, pathname, description) = imp.find_module(name, path)
+        except ImportError:
+            return None
+
+        if package_file:
+            package_file.close()
+
+        return pathname
+
+    @classmethod
+    def get_index(cls, package_name, package_path, loader):
+        """ Get the index of a VSDK package
+
+            The index is read from disk when it exists for the installed
+            package. Otherwise it is generated and stored.
+
+            Args:
+                package_name: the name of the package
+                package_path: the path of the installed package
+                loader: a method that imports and returns the package
+
+            Returns:
+                A VSDKIndex
+
+        """
+        path = cls._get_index_path(package_name, package_path)
+
+        try:
+            with open(path) as index_file:
+                return cls(package_name, json.load(index_file))
+        except (IOError, ValueError):
+            pass
+
+        index = cls.build(package_name, loader())
+        index.save(path)
+
+        return index
+
+    @classmethod
+    def build(cls, package_name, package):
+        """ Build the index by inspecting all classes of a VSDK package
+
+            Args:
+                package_name: the name of the package
+                package: the imported package
+
+            Returns:
+                A VSDKIndex
+
+        """
+        objects = dict()
+        class_names = [name for name in dir(package) if name not in cls.IGNORED_NAMES and name.startswith('NU') and not name.endswith('Fetcher')]
+
+        for class_name in class_names:
+            klass = getattr(package, class_name)
+            instance = klass()
+            attributes = dict()
+
+            for attribute in instance.get_attributes():
+                attributes[attribute.local_name] = {
+                    'remote_name': attribute.remote_name,
+                    'type': attribute.attribute_type.__name__,
+                    'is_required': attribute.is_required,
+                    'is_readonly': attribute.is_readonly,
+                    'choices': attribute.choices
+                }
+
+            objects[klass.rest_name] = {
+                'class_name': class_name,
+                'resource_name': klass.rest_resource_name,
+                'children_rest_names': instance.children_rest_names,
+                'parent_rest_names': [],
+                'attributes': attributes
+            }
+
+        for (rest_name, infos) in objects.iteritems():
+            for child_rest_name in infos['children_rest_names']:
+                if child_rest_name in objects:
+                    objects[child_rest_name]['parent_rest_names'].append(rest_name)
+
+        for infos in objects.itervalues():
+            infos['parent_rest_names'].sort()
+
+        return cls(package_name, objects)
+
+    def save(self, path):
+        """ Atomically writes the index
+
+            Args:
+                path: the path of the index file
+
+        """
+        directory = os.path.dirname(path)
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        (handle, temporary_path) = tempfile.mkstemp(dir=directory)
+        with os.fdopen(handle, 'w') as index_file:
+            json.dump(self._objects, index_file)
+
+        os.rename(temporary_path, path)
+
+    @classmethod
+    def _get_index_path(cls, package_name, package_path):
+        """ Returns the path of the index file
+
+            The name of the file changes whenever the package
+            is installed again.
+
+        """
+        init_file = os.path.join(package_path, '__init__.py')
+        stamp = '%s:%s:%s' % (package_path, os.stat(init_file).st_mtime, cls.FORMAT_VERSION)
+        digest = hashlib.sha1(stamp).hexdigest()[:12]
+
+        return os.path.join(get_cache_directory(), 'index', '%s-%s.json' % (package_name, digest))
+
+    # Lookups
+
+    @property
+    def package_name(self):
+        """ Name of the indexed package """
+
+        return self._package_name
+
+    def get_rest_names(self):
+        """ Returns all indexed rest names """
+
+        return self._objects.keys()
+
+    def has_object(self, rest_name):
+        """ Returns True if the rest name is known """
+
+        return rest_name in self._objects
+
+    def get_class_name(self, rest_name):
+        """ Returns the VSDK class name of the rest name """
+
+        return self._objects[rest_name]['class_name']
+
+    def get_resource_name(self, rest_name):
+        """ Returns the resource name (plural) of the rest name """
+
+        return self._objects[rest_name]['resource_name']
+
+    def get_children_rest_names(self, rest_name):
+        """ Returns the rest names of all children of the rest name """
+
+        return self._objects[rest_name]['children_rest_names']
+
+    def get_parent_rest_names(self, rest_name):
+        """ Returns the rest names of all parents of the rest name """
+
+        return self._objects[rest_name]['parent_rest_names']
+
+    def find_path(self, from_rest_name, to_rest_name):
+        """ Returns the shortest list of rest names going from an object to another through children
+
+            Children are explored in alphabetical order so that the
+            same path is always returned. Returns None if there is no path.
+
+        """
+        previous = {from_rest_name: None}
+        queue = deque([from_rest_name])
+
+        while queue:
+            rest_name = queue.popleft()
+
+            if rest_name == to_rest_name:
+                path = []
+
+                while rest_name is not None:
+                    path.insert(0, rest_name)
+                    rest_name = previous[rest_name]
+
+                return path
+
+            for child_rest_name in sorted(self._objects[rest_name]['children_rest_names']):
+                if child_rest_name in self._objects and child_rest_name not in previous:
+                    previous[child_rest_name] = rest_name
+                    queue.append(child_rest_name)
+
+        return None
+
+    def get_attributes(self, rest_name):
+        """ Returns attributes information of the rest name by python name """
+
+        return self._objects[rest_name]['attributes']
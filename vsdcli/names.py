@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, Alcatel-Lucent Inc
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the names of its contributors
+#       may be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import re
+
+from functools import wraps
+
+
+def memoize(max_size=4096):
+    """ Cache results of a classmethod by arguments
+
+        The cache is emptied when it holds max_size results or
+        when `clear` is called on the decorated function.
+
+    """
+    def decorator(func):
+        results = dict()
+
+        @wraps(func)
+        def wrapper(cls, *args):
+            try:
+                return results[args]
+            except KeyError:
+                pass
+
+            if len(results) >= max_size:
+                results.clear()
+
+            result = results[args] = func(cls, *args)
+            return result
+
+        wrapper.clear = results.clear
+        return wrapper
+
+    return decorator
+
+
+class Names(object):
+    """ Conversions between object, class and attribute names
+
+        Plural and singular forms of rest names come from the rest
+        names and resource names registered from the VSDK index.
+        Suffix rules are only used for other names, like class names.
+
+    """
+
+    INVARIANT_RESOURCES = ['qos', 'vrs', 'cms']
+    VOWELS = ['a', 'e', 'i', 'o', 'u', 'y']
+    REPLACEMENTS = {
+        "VPort": "Vport",
+        "IPID": "IpID"
+    }
+    REPLACEMENTS_RE = re.compile('|'.join([re.escape(key) for key in REPLACEMENTS.keys()]))
+    FIRST_CAP_RE = re.compile('(.)([A-Z](?!s([A-Z])*)[a-z]+)')
+    ALL_CAP_RE = re.compile('([a-z0-9])([A-Z])')
+
+    _resource_names = dict()
+    _rest_names = dict()
+
+    @classmethod
+    def register(cls, resource_names):
+        """ Register resource names of rest names
+
+            Args:
+                resource_names: a dictionary of resource names by rest name
+
+        """
+        cls._resource_names.update(resource_names)
+        cls._rest_names.update(dict((resource_name, rest_name) for (rest_name, resource_name) in resource_names.iteritems()))
+
+        cls.get_singular_name.clear()
+        cls.get_plural_name.clear()
+
+    @classmethod
+    def clean_name(cls, string):
+        """ Force some underscores in names converted by get_python_name """
+
+        return cls.REPLACEMENTS_RE.sub(lambda match: cls.REPLACEMENTS[match.group(0)], string)
+
+    @classmethod
+    @memoize()
+    def get_python_name(cls, name):
+        """ Transform a given name to python name """
+
+        s1 = cls.FIRST_CAP_RE.sub(r'\1_\2', cls.clean_name(name))
+        return cls.ALL_CAP_RE.sub(r'\1_\2', s1).lower()
+
+    @classmethod
+    @memoize()
+    def get_singular_name(cls, plural_name):
+        """ Returns the singular name of the plural name """
+
+        if plural_name in cls._rest_names:
+            return cls._rest_names[plural_name]
+
+        if plural_name in cls.INVARIANT_RESOURCES:
+            return plural_name
+
+        if plural_name[-3:] == 'ies':
+            return plural_name[:-3] + 'y'
+
+        if plural_name[-1] == 's':
+            return plural_name[:-1]
+
+        return plural_name
+
+    @classmethod
+    @memoize()
+    def get_plural_name(cls, singular_name):
+        """ Returns the plural name of the singular name """
+
+        if singular_name in cls._resource_names:
+            return cls._resource_names[singular_name]
+
+        if singular_name in cls.INVARIANT_RESOURCES:
+            return singular_name
+
+        if singular_name[-1:] == 'y' and singular_name[-2] not in cls.VOWELS:
+            return singular_name[:-1] + 'ies'
+
+        if singular_name[-1:] == 's':
+            return singular_name
+
+        return singular_name + 's'
@@ -25,14 +25,19 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import csv
 import sys
 import json
 from collections import OrderedDict
-from colorama import init
-init()
-from colorama import Fore, Style
-from tabulate import tabulate
-from bambou import NURESTObject
+from profiler import Profiler
+
+
+def tabulate(*args, **kwargs):
+    """ Format a table with the tabulate package, imported on first use """
+
+    from tabulate import tabulate as tabulate_table
+
+    return tabulate_table(*args, **kwargs)
 
 
 class Printer(object):
@@ -41,29 +46,68 @@ class Printer(object):
     """
 
     TABULATE_FORMAT = "psql"
+    OUTPUT_FORMATS = ['table', 'json', 'ndjson', 'csv', 'tsv']
+    JSON_INDENT = 4
+    FLUSH_SIZE = 500
+    SAMPLE_SIZE = 100
+
+    _output_format = 'json'
+    _json_lines = False
+    _json_indent = JSON_INDENT
+    _colorama = None
 
     @classmethod
     def colorprint(cls, message, color=''):
         """ Print a messsage in a specific color
 
+            colorama is imported and initialized on first use.
+
             Args:
-                color: the color of the message
+                color: the name of a colorama color (ex: RED)
                 message: the message to print
 
         """
-        print(color + message + Style.RESET_ALL)
+        if cls._colorama is None:
+            import colorama
+            colorama.init()
+            cls._colorama = colorama
+
+        print(getattr(cls._colorama.Fore, color, '') + message + cls._colorama.Style.RESET_ALL)
+
+    @classmethod
+    def set_output_format(cls, output_format='json', compact=False):
+        """ Defines the format used for machine readable output
+
+            Args:
+                output_format: one of json, ndjson (one object per line), csv or tsv
+                compact: True to print JSON objects without indentation
+
+        """
+        cls._output_format = output_format
+        cls._json_lines = output_format == 'ndjson'
+        cls._json_indent = None if cls._json_lines or compact else cls.JSON_INDENT
 
     @classmethod
     def raise_error(cls, message):
-        """ Print an error message
+        """ Print an error message and exit
 
             Args:
                 message: the message to print
 
         """
-        cls.colorprint('[Error] %s' % message, Fore.RED)
+        cls.error(message)
         sys.exit(1)
 
+    @classmethod
+    def error(cls, message):
+        """ Print an error message
+
+            Args:
+                message: the message to print
+
+        """
+        cls.colorprint('[Error] %s' % message, 'RED')
+
     @classmethod
     def success(cls, message):
         """ Print a succcess message
@@ -72,7 +116,7 @@ class Printer(object):
                 message: the message to print
 
         """
-        cls.colorprint('[Success] %s' % message, Fore.GREEN)
+        cls.colorprint('[Success] %s' % message, 'GREEN')
 
     @classmethod
     def warn(cls, message):
@@ -82,7 +126,7 @@ class Printer(object):
                 message: the message to print
         """
 
-        cls.colorprint('[WARNING] %s' % message, Fore.YELLOW)
+        cls.colorprint('[WARNING] %s' % message, 'YELLOW')
 
     @classmethod
     def info(cls, message):
@@ -92,21 +136,60 @@ class Printer(object):
                 message: the message to print
         """
 
-        cls.colorprint('[INFO] %s' % message, Fore.CYAN)
+        cls.colorprint('[INFO] %s' % message, 'CYAN')
 
     @classmethod
+    @Profiler.profiled('render')
     def output(cls, data, fields=None, json=False, headers={}):
         """ Print either json or tabulate data
 
             Args:
                 data: the data to display
+                json: True to print data in the format given to set_output_format
 
         """
-        if json:
+        if json and cls._output_format in ('csv', 'tsv'):
+            cls.csv_pages([data if isinstance(data, list) else [data]], fields)
+        elif json:
             cls.json(data, fields)
         else:
             cls.tabulate(data, fields, headers)
 
+    @classmethod
+    @Profiler.profiled('render')
+    def output_object(cls, obj, fields=None, json=False, headers={}):
+        """ Print one object as attribute and value pairs, or as json
+
+            Args:
+                obj: a VSDK object or a dictionary
+                json: True to print data in the format given to set_output_format
+
+        """
+        dictionary = cls._object_to_dict(obj, fields)
+
+        if json:
+            cls.output(dictionary, json=True)
+        else:
+            print tabulate(dictionary.items(), headers=headers, tablefmt=Printer.TABULATE_FORMAT)
+
+    @classmethod
+    @Profiler.profiled('render')
+    def output_pages(cls, pages, fields=None, json=False, headers={}, widths=None):
+        """ Print either json or tabulate data page by page
+
+            Args:
+                pages: an iterable of lists of objects
+                json: True to print data in the format given to set_output_format
+                widths: a dictionary of known column widths
+
+        """
+        if json and cls._output_format in ('csv', 'tsv'):
+            cls.csv_pages(pages, fields)
+        elif json:
+            cls.json_pages(pages, fields)
+        else:
+            cls.table_pages(pages, fields, widths)
+
     ### PRINTING METHODS
 
     @classmethod
@@ -120,17 +203,200 @@ class Printer(object):
         if isinstance(data, str):
             print(data)
 
-        elif isinstance(data, dict):
-            print(json.dumps(data, indent=4))
-
         elif isinstance(data, list):
-            results = []
-            for obj in data:
-                results.append(cls._object_to_dict(obj, fields))
-            print(json.dumps(results, indent=4))
+            cls.json_pages([data], fields)
 
         else:
-            print(json.dumps(cls._object_to_dict(data, fields), indent=4))
+            print(cls._dumps(cls._get_json_object(data, fields)))
+
+    @classmethod
+    def json_pages(cls, pages, fields):
+        """ Print a json array of objects, or one object per line, as pages arrive
+
+            Objects are encoded one at a time and the output
+            is flushed every FLUSH_SIZE objects and after each page.
+
+            Args:
+                pages: an iterable of lists of objects
+
+        """
+        if cls._json_lines:
+            (start, separator, end, empty) = ('', '\n', '\n', '')
+        elif cls._json_indent is None:
+            (start, separator, end, empty) = ('[', ',', ']\n', '[]\n')
+        else:
+            (start, separator, end, empty) = ('[\n' + ' ' * cls._json_indent, ',\n' + ' ' * cls._json_indent, '\n]\n', '[]\n')
+
+        count = 0
+
+        for page in pages:
+            for obj in page:
+                dump = cls._dumps(cls._get_json_object(obj, fields))
+
+                if cls._json_indent:
+                    dump = dump.replace('\n', '\n' + ' ' * cls._json_indent)
+
+                sys.stdout.write((separator if count else start) + dump)
+                count = count + 1
+
+                if count % cls.FLUSH_SIZE == 0:
+                    sys.stdout.flush()
+
+            sys.stdout.flush()
+
+        sys.stdout.write(end if count else empty)
+        sys.stdout.flush()
+
+    @classmethod
+    def _dumps(cls, data):
+        """ Encode data according to the JSON format
+
+        """
+        if cls._json_indent is None:
+            return json.dumps(data, separators=(',', ':'))
+
+        return json.dumps(data, indent=cls._json_indent)
+
+    @classmethod
+    def _get_json_object(cls, obj, fields):
+        """ Returns what to encode for an object
+
+        """
+        if not isinstance(obj, dict) and hasattr(obj, 'to_dict'):
+            return cls._object_to_dict(obj, fields)
+
+        return obj
+
+    @classmethod
+    def csv_pages(cls, pages, fields):
+        """ Print objects as CSV or TSV rows as pages arrive
+
+            The header is taken from the first object.
+
+            Args:
+                pages: an iterable of lists of objects
+
+        """
+        writer = csv.writer(sys.stdout, delimiter='\t' if cls._output_format == 'tsv' else ',', lineterminator='\n')
+        columns = None
+
+        for page in pages:
+            for obj in page:
+                row = cls._get_json_object(obj, fields)
+
+                if not isinstance(row, dict):
+                    writer.writerow([cls._format_cell(row).encode('utf-8')])
+                    continue
+
+                if columns is None:
+                    columns = row.keys()
+                    writer.writerow(columns)
+
+                writer.writerow([cls._format_cell(row.get(column)).encode('utf-8') for column in columns])
+
+            sys.stdout.flush()
+
+    @classmethod
+    def table_pages(cls, pages, fields=None, widths=None):
+        """ Print a table of objects as pages arrive
+
+            Columns are sized from their header, the given widths and
+            the first SAMPLE_SIZE rows only. Next rows are printed as
+            they arrive without being measured: a longer value makes
+            its row wider than the table instead of being cut.
+
+            Args:
+                pages: an iterable of lists of objects
+                widths: a dictionary of known column widths
+
+        """
+        sample = []
+        layout = None
+
+        for page in pages:
+            for obj in page:
+                row = cls._get_json_object(obj, fields)
+
+                if layout is not None:
+                    cls._write_table_row(layout, row)
+                    continue
+
+                sample.append(row)
+
+                if len(sample) >= cls.SAMPLE_SIZE:
+                    layout = cls._print_table_head(sample, widths)
+
+            sys.stdout.flush()
+
+        if layout is None and len(sample) > 0:
+            layout = cls._print_table_head(sample, widths)
+
+        if layout is not None:
+            cls._write_table_line(layout, '+', '+', '+')
+            sys.stdout.flush()
+
+    @classmethod
+    def _print_table_head(cls, sample, widths):
+        """ Compute the layout of a table from sample rows then print its head and the rows
+
+            Returns:
+                A list of (column, width, right_aligned)
+
+        """
+        widths = widths if widths else dict()
+        layout = []
+
+        for column in sample[0].keys():
+            values = [row.get(column) for row in sample]
+            width = max([len(column), widths.get(column, 0)] + [len(cls._format_cell(value)) for value in values])
+            numbers = [value for value in values if value is not None]
+            right_aligned = len(numbers) > 0 and all([isinstance(value, (int, long, float)) and not isinstance(value, bool) for value in numbers])
+            layout.append((column, width, right_aligned))
+
+        cls._write_table_line(layout, '+', '+', '+')
+        cls._write_table_row(layout, dict([(column, column) for (column, width, right_aligned) in layout]), align=False)
+        cls._write_table_line(layout, '|', '+', '|')
+
+        for row in sample:
+            cls._write_table_row(layout, row)
+
+        return layout
+
+    @classmethod
+    def _write_table_line(cls, layout, left, middle, right):
+        """ Write a horizontal line of a table """
+
+        sys.stdout.write(left + middle.join(['-' * (width + 2) for (column, width, right_aligned) in layout]) + right + '\n')
+
+    @classmethod
+    def _write_table_row(cls, layout, row, align=True):
+        """ Write a row of a table """
+
+        cells = []
+
+        for (column, width, right_aligned) in layout:
+            cell = cls._format_cell(row.get(column))
+            cells.append(cell.rjust(width) if align and right_aligned else cell.ljust(width))
+
+        sys.stdout.write((u'| ' + u' | '.join(cells) + u' |\n').encode('utf-8'))
+
+    @classmethod
+    def _format_cell(cls, value):
+        """ Returns the text of a value in a table or CSV cell """
+
+        if value is None:
+            return u''
+
+        if isinstance(value, unicode):
+            return value
+
+        if isinstance(value, str):
+            return value.decode('utf-8', 'replace')
+
+        if isinstance(value, (list, dict)):
+            return unicode(json.dumps(value))
+
+        return unicode(value)
 
     @classmethod
     def tabulate(cls, data, fields, headers={}):
@@ -150,7 +416,7 @@ class Printer(object):
             results = []
 
             for obj in data:
-                if isinstance(obj, NURESTObject):
+                if isinstance(obj, dict) or hasattr(obj, 'to_dict'):
                     results.append(cls._object_to_dict(obj, fields))
                 else:
                     results.append([obj])
@@ -167,7 +433,7 @@ class Printer(object):
         """ Get object dictionnary with filtered fields
 
         """
-        default_dict = obj.to_dict()
+        default_dict = obj if isinstance(obj, dict) else obj.to_dict()
 
         if fields is None or 'ALL' in fields:
             return default_dict
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, Alcatel-Lucent Inc
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the names of its contributors
+#       may be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+
+class Profiler(object):
+    """ Time spent by a command in each of its phases
+
+        Phases are recorded by name with their number of calls, their
+        total and maximum durations and their own time, which excludes
+        phases nested in them in the same thread. Phases run by worker
+        threads overlap, so their total may exceed the duration of the
+        command.
+
+        Profiling is enabled by `--profile` or the `VSD_PROFILE`
+        environment variable and the report is written on the error
+        output in one of FORMATS when the command ends.
+
+    """
+
+    FORMATS = ['table', 'json', 'prometheus']
+    METRIC_PREFIX = 'vsdcli'
+
+    enabled = False
+
+    _format = None
+    _start = None
+    _phases = OrderedDict()
+    _lock = threading.Lock()
+    _local = threading.local()
+
+    @classmethod
+    def start(cls, output_format):
+        """ Enable profiling until the report is printed
+
+            Args:
+                output_format: one of FORMATS, `True` for table or None to keep profiling disabled
+
+            Raises:
+                ValueError if the format is unknown
+
+        """
+        if not output_format or output_format == 'False':
+            return
+
+        output_format = 'table' if output_format == 'True' else output_format
+
+        if output_format not in cls.FORMATS:
+            raise ValueError('Profile format %s is not one of %s' % (output_format, ', '.join(cls.FORMATS)))
+
+        with cls._lock:
+            cls._phases = OrderedDict()
+
+        cls._format = output_format
+        cls._start = time.time()
+        cls.enabled = True
+
+    @classmethod
+    @contextmanager
+    def phase(cls, name):
+        """ Record the time spent in a block
+
+            Args:
+                name: the name of the phase
+
+        """
+        if not cls.enabled:
+            yield
+            return
+
+        stack = cls._get_stack()
+        stack.append(0)
+        start = time.time()
+
+        try:
+            yield
+        finally:
+            duration = time.time() - start
+            nested = stack.pop()
+
+            if stack:
+                stack[-1] += duration
+
+            cls.record(name, duration, duration - nested)
+
+    @classmethod
+    def profiled(cls, name):
+        """ Decorator recording the time spent in a function
+
+            Args:
+                name: the name of the phase
+
+        """
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with cls.phase(name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    @classmethod
+    def record(cls, name, duration, own_duration=None):
+        """ Record one call of a phase
+
+            Args:
+                name: the name of the phase
+                duration: the duration of the call in seconds
+                own_duration: the duration without nested phases (default: duration)
+
+        """
+        if not cls.enabled:
+            return
+
+        own_duration = duration if own_duration is None else own_duration
+
+        with cls._lock:
+            timing = cls._phases.setdefault(name, {'calls': 0, 'total': 0.0, 'own': 0.0, 'max': 0.0})
+            timing['calls'] += 1
+            timing['total'] += duration
+            timing['own'] += own_duration
+            timing['max'] = max(timing['max'], duration)
+
+    @classmethod
+    def stop(cls, command=None):
+        """ Print the report and disable profiling
+
+            Args:
+                command: the name of the profiled command
+
+        """
+        if not cls.enabled:
+            return
+
+        cls.enabled = False
+        duration = time.time() - cls._start
+
+        with cls._lock:
+            phases = cls._phases
+            cls._phases = OrderedDict()
+
+        report = getattr(cls, '_format_%s' % cls._format)(command, duration, phases)
+        sys.stdout.flush()
+        sys.stderr.write(report)
+        sys.stderr.flush()
+
+    @classmethod
+    def _get_stack(cls):
+        """ Returns the durations of nested phases running in the current thread """
+
+        if not hasattr(cls._local, 'stack'):
+            cls._local.stack = []
+
+        return cls._local.stack
+
+    @classmethod
+    def _format_table(cls, command, duration, phases):
+        """ Returns the report as a table """
+
+        from printer import Printer, tabulate
+
+        rows = [[name, timing['calls'], timing['total'] * 1000, timing['own'] * 1000, timing['total'] * 1000 / timing['calls'], timing['max'] * 1000, 100 * timing['own'] / duration if duration else 0]
+                for (name, timing) in phases.iteritems()]
+        rows.append(['command %s' % command if command else 'command', 1, duration * 1000, None, None, None, None])
+
+        return tabulate(rows, headers=['Phase', 'Calls', 'Total (ms)', 'Own (ms)', 'Mean (ms)', 'Max (ms)', 'Own (%)'], tablefmt=Printer.TABULATE_FORMAT, floatfmt='.1f') + '\n'
+
+    @classmethod
+    def _format_json(cls, command, duration, phases):
+        """ Returns the report as a JSON object """
+
+        import json
+
+        report = OrderedDict([('command', command), ('duration', duration), ('phases', [])])
+
+        for (name, timing) in phases.iteritems():
+            report['phases'].append(OrderedDict([('name', name), ('calls', timing['calls']), ('total', timing['total']), ('own', timing['own']), ('max', timing['max'])]))
+
+        return json.dumps(report) + '\n'
+
+    @classmethod
+    def _format_prometheus(cls, command, duration, phases):
+        """ Returns the report in Prometheus text exposition format """
+
+        prefix = cls.METRIC_PREFIX
+        command_label = 'command="%s"' % cls._escape_label(command or '')
+        metrics = [('phase_seconds_total', 'counter', 'Time spent in each phase, nested phases included', 'total'),
+                   ('phase_own_seconds_total', 'counter', 'Time spent in each phase, nested phases excluded', 'own'),
+                   ('phase_max_seconds', 'gauge', 'Longest call of each phase', 'max'),
+                   ('phase_calls_total', 'counter', 'Number of calls of each phase', 'calls')]
+
+        lines = ['# HELP %s_command_duration_seconds Duration of the command' % prefix,
+                 '# TYPE %s_command_duration_seconds gauge' % prefix,
+                 '%s_command_duration_seconds{%s} %r' % (prefix, command_label, duration)]
+
+        for (metric, metric_type, description, key) in metrics:
+            lines.append('# HELP %s_%s %s' % (prefix, metric, description))
+            lines.append('# TYPE %s_%s %s' % (prefix, metric, metric_type))
+
+            for (name, timing) in phases.iteritems():
+                lines.append('%s_%s{%s,phase="%s"} %r' % (prefix, metric, command_label, cls._escape_label(name), timing[key]))
+
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def _escape_label(cls, value):
+        """ Returns a value escaped for a Prometheus label """
+
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
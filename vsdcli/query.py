@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, Alcatel-Lucent Inc
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the names of its contributors
+#       may be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import cPickle
+import heapq
+import json
+import os
+import tempfile
+
+from collections import OrderedDict
+from itertools import count as counter
+
+
+class QueryError(ValueError):
+    """ Error of a query option
+
+    """
+
+    pass
+
+
+class Descending(object):
+    """ Value sorted in reverse order
+
+    """
+
+    __slots__ = ['value']
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+class Query(object):
+    """ Sort, group and aggregate objects on the client side
+
+        Queries run over the stream of pages fetched from the VSD:
+
+        * group by uses hash aggregation. Only one row of aggregates
+          is kept per group, whatever the number of objects.
+        * sort keeps at most `buffer_size` objects in memory. Larger
+          streams are sorted by runs of `buffer_size` objects spilled
+          to temporary files, then merged.
+
+        Aggregates run after grouping (on all objects when no group
+        is given) and sort runs last, so that groups can be sorted by
+        their aggregates.
+
+    """
+
+    AGGREGATES = ['count', 'sum', 'min', 'max']
+    DEFAULT_BUFFER_SIZE = 100000
+    PAGE_SIZE = 500
+
+    def __init__(self, sort=None, group_by=None, aggregates=None, fields=None, buffer_size=None):
+        """ Initializes the query
+
+            Args:
+                sort: a list of FIELD or FIELD:desc
+                group_by: a list of fields
+                aggregates: a list of count, sum:FIELD, min:FIELD or max:FIELD
+                fields: the output fields of objects when they are not grouped
+                buffer_size: the number of objects sorted in memory (default: VSD_SORT_BUFFER_SIZE or DEFAULT_BUFFER_SIZE)
+
+            Raises:
+                QueryError if an option is invalid
+
+        """
+        self._sort = [self._parse_sort(spec) for spec in sort or []]
+        self._group_by = group_by or []
+        self._aggregates = [self._parse_aggregate(spec) for spec in aggregates or []]
+        self._fields = fields if fields and 'ALL' not in fields else None
+        self._buffer_size = buffer_size or int(os.environ.get('VSD_SORT_BUFFER_SIZE', self.DEFAULT_BUFFER_SIZE))
+
+        if self._group_by and not self._aggregates:
+            self._aggregates = [('count', None)]
+
+        if self.is_aggregated:
+            columns = self._group_by + self._get_aggregate_names()
+
+            for (field, descending) in self._sort:
+                if field not in columns:
+                    raise QueryError('Cannot sort by %s, aggregated rows have %s' % (field, ', '.join(columns)))
+
+        if self._buffer_size < 1:
+            raise QueryError('VSD_SORT_BUFFER_SIZE must be a positive number')
+
+    @classmethod
+    def from_arguments(cls, args):
+        """ Returns the query of command line arguments or None
+
+            Raises:
+                QueryError if an option is invalid
+
+        """
+        (sort, group_by, aggregates) = (getattr(args, 'sort', None), getattr(args, 'group_by', None), getattr(args, 'aggregates', None))
+
+        if not sort and not group_by and not aggregates:
+            return None
+
+        return cls(sort=sort, group_by=group_by, aggregates=aggregates, fields=getattr(args, 'fields', None))
+
+    @property
+    def is_aggregated(self):
+        """ True if the query returns rows of aggregates instead of objects """
+
+        return len(self._aggregates) > 0
+
+    def get_fields(self):
+        """ Returns the fields to fetch, or None for all fields
+
+        """
+        if self.is_aggregated:
+            fields = self._group_by + [field for (function, field) in self._aggregates if field]
+            fields = fields + [field for (field, descending) in self._sort if field not in fields and field not in self._get_aggregate_names()]
+        elif self._fields:
+            fields = self._fields + [field for (field, descending) in self._sort if field not in self._fields]
+        else:
+            return None
+
+        # The target of an object is added by the CLI, not sent by the VSD
+        return [field for field in OrderedDict.fromkeys(fields) if field != 'target'] or ['ID']
+
+    def run(self, pages):
+        """ Run the query over pages of objects
+
+            Args:
+                pages: an iterable of lists of objects
+
+            Returns:
+                A generator of lists of dictionaries
+
+            Raises:
+                QueryError if no object has a sort field
+
+        """
+        rows = (self._to_dict(obj) for page in pages for obj in page)
+
+        if self.is_aggregated:
+            rows = self._aggregate(rows)
+
+        if self._sort:
+            rows = self._sort_rows(rows)
+
+        if self._fields and not self.is_aggregated:
+            rows = (self._project(row) for row in rows)
+
+        page = []
+
+        for row in rows:
+            page.append(row)
+
+            if len(page) >= self.PAGE_SIZE:
+                yield page
+                page = []
+
+        if page:
+            yield page
+
+    def _aggregate(self, rows):
+        """ Returns one row of aggregates per group, ordered by group """
+
+        groups = dict()
+
+        for row in rows:
+            key = tuple(self._get_hashable(row.get(field)) for field in self._group_by)
+            group = groups.get(key)
+
+            if group is None:
+                group = groups[key] = [[row.get(field) for field in self._group_by], [None] * len(self._aggregates)]
+
+            values = group[1]
+
+            for (index, (function, field)) in enumerate(self._aggregates):
+                if function == 'count':
+                    values[index] = (values[index] or 0) + 1
+                    continue
+
+                value = row.get(field)
+
+                if value is None:
+                    continue
+
+                if values[index] is None:
+                    values[index] = value
+                elif function == 'sum':
+                    values[index] += value
+                elif function == 'min':
+                    values[index] = min(values[index], value)
+                else:
+                    values[index] = max(values[index], value)
+
+        names = self._get_aggregate_names()
+
+        if not groups and not self._group_by:
+            groups[()] = [[], [0 if function == 'count' else None for (function, field) in self._aggregates]]
+
+        for key in sorted(groups):
+            (group_values, values) = groups[key]
+            yield OrderedDict(zip(self._group_by, group_values) + zip(names, values))
+
+    def _sort_rows(self, rows):
+        """ Returns rows sorted in memory, or with an external merge sort when they do not fit """
+
+        sequence = counter()
+        buffer = []
+        runs = []
+        fields = [field for (field, descending) in self._sort]
+        missing = set(fields)
+
+        try:
+            for row in rows:
+                if missing:
+                    missing.difference_update(row)
+
+                buffer.append((self._get_sort_key(row), next(sequence), row))
+
+                if len(buffer) >= self._buffer_size:
+                    runs.append(self._spill(buffer))
+                    buffer = []
+
+            # Objects may omit empty attributes, a field is unknown when no object has it
+            if missing and (buffer or runs):
+                row = buffer[0][2] if buffer else self._read_run(runs[0]).next()
+                raise QueryError('Cannot sort by %s, no result has this field. Fields are %s' % (', '.join([field for field in fields if field in missing]), ', '.join(row)))
+
+            buffer.sort()
+
+            if not runs:
+                for (key, position, row) in buffer:
+                    yield row
+                return
+
+            runs.append(self._spill(buffer))
+
+            for (key, position, row) in heapq.merge(*[self._read_run(run) for run in runs]):
+                yield row
+        finally:
+            for run in runs:
+                run.close()
+
+    def _spill(self, buffer):
+        """ Write sorted rows to a temporary file and returns it """
+
+        buffer.sort()
+        run = tempfile.TemporaryFile()
+
+        for (key, position, row) in buffer:
+            cPickle.dump((position, row), run, cPickle.HIGHEST_PROTOCOL)
+
+        run.seek(0)
+
+        return run
+
+    def _read_run(self, run):
+        """ Returns a generator of the sorted rows of a temporary file """
+
+        while True:
+            try:
+                (position, row) = cPickle.load(run)
+            except EOFError:
+                return
+
+            yield (self._get_sort_key(row), position, row)
+
+    def _get_sort_key(self, row):
+        """ Returns the key sorting a row """
+
+        return tuple(Descending(row.get(field)) if descending else row.get(field) for (field, descending) in self._sort)
+
+    def _get_aggregate_names(self):
+        """ Returns the output names of aggregates like count or sum(VLAN) """
+
+        return [function if field is None else '%s(%s)' % (function, field) for (function, field) in self._aggregates]
+
+    def _project(self, row):
+        """ Returns a row with output fields only """
+
+        fields = ['target'] + self._fields if 'target' in row else self._fields
+
+        return OrderedDict([(field, row[field]) for field in fields if field in row])
+
+    def _to_dict(self, obj):
+        """ Returns the dictionary of an object """
+
+        if isinstance(obj, dict):
+            return obj
+
+        from printer import Printer
+        return Printer._object_to_dict(obj)
+
+    def _get_hashable(self, value):
+        """ Returns a value that can be used in a group key """
+
+        if isinstance(value, (list, dict)):
+            return json.dumps(value, sort_keys=True)
+
+        return value
+
+    def _parse_sort(self, spec):
+        """ Returns (field, descending) from FIELD, FIELD:asc or FIELD:desc """
+
+        (field, separator, order) = spec.rpartition(':') if spec.endswith((':asc', ':desc')) else (spec, '', 'asc')
+
+        if not field:
+            raise QueryError('Invalid sort %s, expected FIELD or FIELD:desc' % spec)
+
+        return (field, order == 'desc')
+
+    def _parse_aggregate(self, spec):
+        """ Returns (function, field) from count or FUNCTION:FIELD """
+
+        (function, separator, field) = spec.partition(':')
+
+        if function not in self.AGGREGATES:
+            raise QueryError('Invalid aggregate %s, expected one of %s' % (spec, ', '.join(['count', 'sum:FIELD', 'min:FIELD', 'max:FIELD'])))
+
+        if function == 'count' and field:
+            raise QueryError('Invalid aggregate %s, count takes no field' % spec)
+
+        if function != 'count' and not field:
+            raise QueryError('Invalid aggregate %s, %s needs a field like %s:FIELD' % (spec, function, function))
+
+        return (function, field or None)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, Alcatel-Lucent Inc
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the names of its contributors
+#       may be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import random
+import threading
+import time
+
+
+class RateLimiter(object):
+    """ Token bucket limiting the number of operations per second
+
+        Tokens are added at `rate` per second up to `burst`. Each
+        call to acquire takes one token and waits when none is left.
+
+    """
+
+    def __init__(self, rate, burst=None):
+        """ Initializes the rate limiter
+
+            Args:
+                rate: the number of operations per second. None or 0 disables the limit.
+                burst: the maximum number of operations allowed at once
+
+        """
+        self._rate = float(rate) if rate else None
+        self._burst = float(burst) if burst else max(1.0, self._rate or 1.0)
+        self._tokens = self._burst
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """ Take one token, waiting if needed
+
+        """
+        if self._rate is None:
+            return
+
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            self._tokens = self._tokens - 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ConcurrencyLimiter(object):
+    """ Limit of operations in flight adapted to the load of the server
+
+        The limit grows by one every `limit` operations that succeed
+        in a normal time (additive increase) and is halved when an
+        operation reports an overload or is much slower than usual
+        (multiplicative decrease), at most once per usual duration.
+
+    """
+
+    LATENCY_FACTOR = 4
+    SMOOTHING = 0.1
+
+    def __init__(self, maximum, minimum=1):
+        """ Initializes the limiter
+
+            Args:
+                maximum: the maximum number of operations in flight, also the initial limit
+                minimum: the minimum number of operations in flight
+
+        """
+        self._maximum = float(max(1, maximum))
+        self._minimum = float(max(1, min(minimum, maximum)))
+        self._limit = self._maximum
+        self._in_flight = 0
+        self._latencies = dict()
+        self._last_decrease = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        """ Current number of operations allowed in flight """
+
+        return int(self._limit)
+
+    def acquire(self):
+        """ Wait until an operation can start
+
+        """
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+
+            self._in_flight += 1
+
+    def release(self, kind, latency, overloaded=False):
+        """ Report the end of an operation
+
+            Args:
+                kind: the kind of operation, latencies are compared by kind
+                latency: the duration of the operation in seconds
+                overloaded: True if the server reported an overload
+
+        """
+        with self._condition:
+            self._in_flight -= 1
+            usual_latency = self._latencies.get(kind, latency)
+            now = time.time()
+
+            if overloaded or latency > usual_latency * self.LATENCY_FACTOR:
+                if now - self._last_decrease > usual_latency:
+                    self._limit = max(self._minimum, self._limit / 2)
+                    self._last_decrease = now
+            else:
+                self._limit = min(self._maximum, self._limit + 1 / self._limit)
+
+            if not overloaded:
+                self._latencies[kind] = usual_latency + (latency - usual_latency) * self.SMOOTHING
+
+            self._condition.notify_all()
+
+
+class RetryScheduler(object):
+    """ Run operations with rate limiting, adaptive concurrency and retries
+
+        Each attempt takes a token of the rate limiter and a slot of
+        the concurrency limiter. Failed attempts that are safe to
+        retry are run again after a jittered exponential backoff:
+        a random delay between 0 and backoff * 2 ^ attempt seconds,
+        at most max_backoff, or the delay asked by the server.
+
+    """
+
+    def __init__(self, rate=None, concurrency=10, retries=3, backoff=0.5, max_backoff=30):
+        """ Initializes the scheduler
+
+            Args:
+                rate: the maximum number of attempts per second. None or 0 disables the limit.
+                concurrency: the maximum number of attempts in flight
+                retries: the maximum number of retries of an operation
+                backoff: the base delay between retries in seconds
+                max_backoff: the maximum delay between retries in seconds
+
+        """
+        self.rate_limiter = RateLimiter(rate)
+        self.concurrency_limiter = ConcurrencyLimiter(concurrency)
+        self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+
+    def run(self, kind, operation, classify):
+        """ Run an operation until it succeeds or cannot be retried
+
+            Args:
+                kind: the kind of operation. Latencies of operations of a kind must be comparable.
+                operation: a function running one attempt
+                classify: a function called with (result, error) of an attempt
+                          returning a tuple (retry, overloaded, delay). delay is
+                          the number of seconds asked by the server or None.
+
+            Returns:
+                The result of the last attempt
+
+            Raises:
+                The error of the last attempt
+
+        """
+        attempt = 0
+
+        while True:
+            self.rate_limiter.acquire()
+            self.concurrency_limiter.acquire()
+
+            (result, error) = (None, None)
+            start = time.time()
+
+            try:
+                result = operation()
+            except Exception, e:
+                error = e
+
+            (retry, overloaded, delay) = classify(result, error)
+            self.concurrency_limiter.release(kind, time.time() - start, overloaded)
+
+            if not retry or attempt >= self._retries:
+                if error is not None:
+                    raise error
+
+                return result
+
+            time.sleep(self._get_delay(attempt, delay))
+            attempt += 1
+
+    def _get_delay(self, attempt, delay=None):
+        """ Returns the number of seconds to wait before a retry """
+
+        if delay is not None:
+            return min(self._max_backoff, delay)
+
+        return random.uniform(0, min(self._max_backoff, self._backoff * 2 ** attempt))
@@ -0,0 +1,497 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, Alcatel-Lucent Inc
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the names of its contributors
+#       may be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import json
+import os
+import re
+import shutil
+import sqlite3
+
+
+class Snapshot(object):
+    """ Local copy of an object and all its descendants
+
+        Objects are stored as sent by the VSD in a SQLite database
+        with indexes on ID, parentID and name. Each fetched parent and
+        child relation is stored too so that children are found the
+        same way the VSD returns them, including assigned objects and
+        objects fetched from a grand parent (like vports of a domain).
+
+    """
+
+    ROOT = ''
+    EXCLUDED_CHILDREN = ['eventlogs', 'statistics', 'jobs']
+    SYNC_MARGIN = 60
+    SKIPPED_STATUSES = [403, 404, 405]
+
+    def __init__(self, path, connection):
+        """ Initializes the snapshot
+
+            Use `Snapshot.create` or `Snapshot.open` instead.
+
+        """
+        self.path = path
+        self._connection = connection
+
+    @classmethod
+    def create(cls, path):
+        """ Create an empty snapshot
+
+            The snapshot is written in a temporary file that replaces
+            the file at path when `save` is called.
+
+            Args:
+                path: the path of the snapshot
+
+            Returns:
+                A Snapshot
+
+        """
+        temporary_path = path + '.tmp'
+
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+        connection = sqlite3.connect(temporary_path)
+        connection.execute('CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT)')
+        connection.execute('CREATE TABLE objects (ID TEXT PRIMARY KEY, restName TEXT, parentID TEXT, parentType TEXT, name TEXT, data TEXT)')
+        connection.execute('CREATE TABLE children (parentID TEXT, restName TEXT, ID TEXT, PRIMARY KEY (parentID, restName, ID))')
+        connection.execute('CREATE INDEX objects_parent ON objects (parentID)')
+        connection.execute('CREATE INDEX objects_name ON objects (name)')
+        connection.execute('CREATE INDEX objects_rest_name ON objects (restName)')
+
+        return cls(path, connection)
+
+    @classmethod
+    def open(cls, path):
+        """ Open an existing snapshot
+
+            Args:
+                path: the path of the snapshot
+
+            Returns:
+                A Snapshot
+
+            Raises:
+                IOError if the file is not a snapshot
+
+        """
+        if not os.path.isfile(path):
+            raise IOError('No snapshot found at %s' % path)
+
+        connection = sqlite3.connect(path)
+
+        try:
+            connection.execute('SELECT COUNT(*) FROM info').fetchone()
+        except sqlite3.DatabaseError:
+            raise IOError('%s is not a snapshot' % path)
+
+        return cls(path, connection)
+
+    @classmethod
+    def update(cls, path):
+        """ Open a copy of an existing snapshot to update it
+
+            The copy replaces the file at path when `save` is called.
+
+            Args:
+                path: the path of the snapshot
+
+            Returns:
+                A Snapshot
+
+            Raises:
+                IOError if the file is not a snapshot
+
+        """
+        cls.open(path)._connection.close()
+        shutil.copyfile(path, path + '.tmp')
+
+        return cls(path, sqlite3.connect(path + '.tmp'))
+
+    def save(self):
+        """ Write the snapshot to its path
+
+        """
+        self._connection.commit()
+        self._connection.close()
+
+        os.rename(self.path + '.tmp', self.path)
+
+    def set_info(self, key, value):
+        """ Set an information about the snapshot (root, version...)
+
+        """
+        self._connection.execute('INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def set_sync_date(self, sync_date):
+        """ Set the date from which the next incremental sync fetches updated objects
+
+            It must be taken before crawling: objects fetched at the
+            beginning of a crawl may be updated while the end of the
+            crawl fetches other objects. It is set once the crawl
+            succeeded.
+
+            Args:
+                sync_date: a timestamp in milliseconds, like lastUpdatedDate
+
+        """
+        self.set_info('lastUpdatedDate', sync_date)
+
+    def get_sync_date(self):
+        """ Returns the date after which objects must be fetched by an incremental sync
+
+            The date is moved back by SYNC_MARGIN seconds for clock
+            differences between nodes of the VSD.
+
+        """
+        return self.get_info('lastUpdatedDate', 0) - self.SYNC_MARGIN * 1000
+
+    def get_info(self, key, default=None):
+        """ Get an information about the snapshot
+
+        """
+        row = self._connection.execute('SELECT value FROM info WHERE key = ?', (key, )).fetchone()
+
+        return json.loads(row[0]) if row else default
+
+    def add(self, rest_name, parent_id, objects):
+        """ Add children of a parent
+
+            Args:
+                rest_name: the rest name of the children
+                parent_id: the ID of the parent or Snapshot.ROOT
+                objects: a list of dictionaries as sent by the VSD
+
+        """
+        self._connection.executemany('INSERT OR REPLACE INTO objects (ID, restName, parentID, parentType, name, data) VALUES (?, ?, ?, ?, ?, ?)',
+                                     [(obj['ID'], rest_name, obj.get('parentID'), obj.get('parentType'), obj.get('name'), json.dumps(obj, separators=(',', ':'))) for obj in objects])
+        self._connection.executemany('INSERT OR IGNORE INTO children (parentID, restName, ID) VALUES (?, ?, ?)',
+                                     [(parent_id, rest_name, obj['ID']) for obj in objects])
+
+    def remove_children(self, parent_id, rest_name, keep):
+        """ Remove children of a parent that are not in a list
+
+            Objects are kept until `remove_orphans` is called.
+
+            Args:
+                parent_id: the ID of the parent
+                rest_name: the rest name of the children
+                keep: the identifiers of the children to keep
+
+        """
+        removed = [(parent_id, rest_name, id) for id in self.get_children_ids(parent_id, rest_name) if id not in keep]
+        self._connection.executemany('DELETE FROM children WHERE parentID = ? AND restName = ? AND ID = ?', removed)
+
+    def remove_orphans(self):
+        """ Remove objects that are not a child of any saved object, and their descendants
+
+            Returns:
+                The number of removed objects
+
+        """
+        removed = 0
+
+        while True:
+            self._connection.execute('DELETE FROM children WHERE parentID != ? AND parentID NOT IN (SELECT ID FROM objects)', (self.ROOT, ))
+            count = self._connection.execute('DELETE FROM objects WHERE ID NOT IN (SELECT ID FROM children)').rowcount
+
+            if count <= 0:
+                return removed
+
+            removed += count
+
+    def count_objects(self):
+        """ Returns the number of saved objects """
+
+        return self._connection.execute('SELECT COUNT(*) FROM objects').fetchone()[0]
+
+    def get_ids(self):
+        """ Returns the set of identifiers of all saved objects """
+
+        return set([row[0] for row in self._connection.execute('SELECT ID FROM objects')])
+
+    def get_children_ids(self, parent_id, rest_name):
+        """ Returns the set of identifiers of children of a parent """
+
+        return set([row[0] for row in self._connection.execute('SELECT ID FROM children WHERE parentID = ? AND restName = ?', (parent_id, rest_name))])
+
+    def get_relations(self, parent_id):
+        """ Returns a list of (rest name, ID) of all children of a parent """
+
+        return self._connection.execute('SELECT restName, ID FROM children WHERE parentID = ? ORDER BY rowid', (parent_id, )).fetchall()
+
+    def get_children(self, parent_id, rest_name, filter=None):
+        """ Get children of a parent
+
+            Args:
+                parent_id: the ID of the parent or Snapshot.ROOT
+                rest_name: the rest name of the children
+                filter: a filter predicate
+
+            Returns:
+                A list of dictionaries
+
+        """
+        rows = self._connection.execute('SELECT objects.data FROM children JOIN objects ON objects.ID = children.ID WHERE children.parentID = ? AND children.restName = ? ORDER BY children.rowid',
+                                        (parent_id, rest_name))
+
+        return self._filter_rows(rows, filter)
+
+    def get_objects(self, rest_name, ids=None, filter=None):
+        """ Get objects of a kind
+
+            Args:
+                rest_name: the rest name of the objects
+                ids: the identifiers of the objects or None to get all of them
+                filter: a filter predicate
+
+            Returns:
+                A list of dictionaries
+
+        """
+        if ids is None:
+            rows = self._connection.execute('SELECT data FROM objects WHERE restName = ? ORDER BY rowid', (rest_name, ))
+            return self._filter_rows(rows, filter)
+
+        objects = []
+
+        for id in ids:
+            row = self._connection.execute('SELECT data FROM objects WHERE ID = ? AND restName = ?', (id, rest_name)).fetchone()
+            objects.append(json.loads(row[0]) if row else None)
+
+        return objects
+
+    def _filter_rows(self, rows, filter):
+        """ Returns decoded rows matching a filter predicate """
+
+        objects = [json.loads(row[0]) for row in rows]
+
+        if not filter:
+            return objects
+
+        predicate = SnapshotFilter(filter)
+
+        return [obj for obj in objects if predicate.match(obj)]
+
+
+class SnapshotFilter(object):
+    """ Filter predicate of the VSD evaluated on snapshot objects
+
+        Supports comparisons with ==, !=, >, >=, <, <=, BEGINSWITH,
+        ENDSWITH and CONTAINS combined with AND, OR and parentheses.
+        Example: `name BEGINSWITH 'Test' AND (type == 'VM' OR type == 'HOST')`
+
+    """
+
+    TOKENS = re.compile(r"""\s*(?:('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|(==|!=|>=|<=|>|<|\(|\))|([^\s()=!<>'"]+))""")
+    OPERATORS = ['==', '!=', '>=', '<=', '>', '<', 'BEGINSWITH', 'ENDSWITH', 'CONTAINS']
+
+    def __init__(self, expression):
+        """ Parses a filter predicate
+
+            Raises:
+                ValueError if the predicate is not supported
+
+        """
+        self._tokens = self._tokenize(expression)
+        self._position = 0
+        self._predicate = self._parse_or()
+
+        if self._position < len(self._tokens):
+            raise ValueError('Unexpected %s in filter %s' % (self._tokens[self._position][1], expression))
+
+    def match(self, obj):
+        """ Returns True if the object matches the predicate """
+
+        return self._predicate(obj)
+
+    def _tokenize(self, expression):
+        """ Returns a list of (kind, value) """
+
+        tokens = []
+        position = 0
+        expression = expression.strip()
+
+        while position < len(expression):
+            match = self.TOKENS.match(expression, position)
+
+            if match is None or match.end() == position:
+                raise ValueError('Cannot parse filter %s' % expression)
+
+            (string, symbol, word) = match.groups()
+
+            if string is not None:
+                tokens.append(('value', re.sub(r'\\(.)', r'\1', string[1:-1])))
+            elif symbol is not None:
+                tokens.append(('symbol', symbol))
+            else:
+                tokens.append(('word', word))
+
+            position = match.end()
+
+        return tokens
+
+    def _next(self):
+        """ Returns the next token and moves to the following one """
+
+        if self._position >= len(self._tokens):
+            raise ValueError('Unexpected end of filter')
+
+        token = self._tokens[self._position]
+        self._position += 1
+
+        return token
+
+    def _peek_keyword(self, keyword):
+        """ Returns True if the next token is the keyword """
+
+        if self._position >= len(self._tokens):
+            return False
+
+        (kind, value) = self._tokens[self._position]
+
+        return kind == 'word' and value.upper() == keyword
+
+    def _parse_or(self):
+        """ Parses predicates combined with OR """
+
+        predicates = [self._parse_and()]
+
+        while self._peek_keyword('OR'):
+            self._position += 1
+            predicates.append(self._parse_and())
+
+        return predicates[0] if len(predicates) == 1 else lambda obj: any(predicate(obj) for predicate in predicates)
+
+    def _parse_and(self):
+        """ Parses predicates combined with AND """
+
+        predicates = [self._parse_comparison()]
+
+        while self._peek_keyword('AND'):
+            self._position += 1
+            predicates.append(self._parse_comparison())
+
+        return predicates[0] if len(predicates) == 1 else lambda obj: all(predicate(obj) for predicate in predicates)
+
+    def _parse_comparison(self):
+        """ Parses a comparison or a predicate between parentheses """
+
+        (kind, value) = self._next()
+
+        if (kind, value) == ('symbol', '('):
+            predicate = self._parse_or()
+
+            if self._next() != ('symbol', ')'):
+                raise ValueError('Missing closing parenthesis in filter')
+
+            return predicate
+
+        if kind != 'word':
+            raise ValueError('Expected an attribute name instead of %s' % value)
+
+        attribute = value
+        operator = self._next()[1]
+
+        if operator.upper() not in self.OPERATORS:
+            raise ValueError('Unsupported operator %s in filter' % operator)
+
+        expected = self._get_value(self._next())
+
+        return self._get_predicate(attribute, operator.upper(), expected)
+
+    def _get_value(self, token):
+        """ Returns the python value of a literal """
+
+        (kind, value) = token
+
+        if kind == 'value':
+            return value
+
+        if kind != 'word':
+            raise ValueError('Expected a value instead of %s' % value)
+
+        literals = {'true': True, 'false': False, 'null': None}
+
+        if value.lower() in literals:
+            return literals[value.lower()]
+
+        try:
+            return int(value)
+        except ValueError:
+            pass
+
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+    def _get_predicate(self, attribute, operator, expected):
+        """ Returns a function comparing an attribute of an object to a value """
+
+        def compare(obj):
+            actual = obj.get(attribute)
+
+            if operator in ('BEGINSWITH', 'ENDSWITH', 'CONTAINS'):
+                if actual is None:
+                    return False
+
+                (actual_text, expected_text) = (unicode(actual), unicode(expected))
+
+                if operator == 'BEGINSWITH':
+                    return actual_text.startswith(expected_text)
+
+                if operator == 'ENDSWITH':
+                    return actual_text.endswith(expected_text)
+
+                return expected_text in actual_text
+
+            if operator in ('==', '!='):
+                equal = actual == expected or (actual is not None and expected is not None and unicode(actual) == unicode(expected))
+                return equal if operator == '==' else not equal
+
+            if actual is None or expected is None:
+                return False
+
+            if isinstance(expected, (int, float)) and not isinstance(actual, (int, float)):
+                try:
+                    actual = float(actual)
+                except ValueError:
+                    return False
+
+            if operator == '>':
+                return actual > expected
+
+            if operator == '>=':
+                return actual >= expected
+
+            if operator == '<':
+                return actual < expected
+
+            return actual <= expected
+
+        return compare
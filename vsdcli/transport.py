@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, Alcatel-Lucent Inc
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the names of its contributors
+#       may be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import os
+import re
+import ssl
+import threading
+import urlparse
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import NewConnectionError
+from requests.packages.urllib3.util.ssl_ import create_urllib3_context
+
+from profiler import Profiler
+from scheduler import RetryScheduler
+
+
+class TransportAdapter(HTTPAdapter):
+    """ HTTP adapter using the TLS context of the transport
+
+        A TLS context given to the pools takes precedence over the
+        TLS version forced on every PoolManager by bambou.
+
+    """
+
+    def __init__(self, ssl_context, **kwargs):
+        """ Initializes the adapter
+
+            Args:
+                ssl_context: the TLS context of all connections
+
+        """
+        self._ssl_context = ssl_context
+        super(TransportAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self._ssl_context
+        return super(TransportAdapter, self).init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        kwargs['ssl_context'] = self._ssl_context
+        return super(TransportAdapter, self).proxy_manager_for(*args, **kwargs)
+
+
+class Transport(object):
+    """ HTTP transport shared by all commands and threads
+
+        Requests are sent through a single requests session whose
+        connection pools keep connections alive, so that TCP and TLS
+        handshakes happen once per connection instead of once per
+        request. Responses are compressed with gzip when the VSD
+        supports it.
+
+        The transport is given to bambou in place of the requests
+        module and is configured with environment variables:
+
+        * `VSD_POOL_SIZE` connections kept per VSD (default: the number of threads, at least 10)
+        * `VSD_CONNECT_TIMEOUT` seconds to wait for a connection (default: 10)
+        * `VSD_READ_TIMEOUT` seconds to wait for a response (default: bambou's timeout)
+        * `VSD_TLS_VERSION` TLSv1, TLSv1_1 or TLSv1_2 to force a TLS version (default: negotiated)
+
+        Every request goes through a RetryScheduler shared by all
+        threads: at most `VSD_RATE_LIMIT` requests are sent per second
+        and the number of requests in flight, up to the pool size, is
+        lowered while the VSD is overloaded or slow and raised again
+        when it recovers. Requests that fail in a way that is safe to
+        retry are sent again at most `VSD_RETRIES` times:
+
+        * every request on 429 and 503, or when no connection could be made
+        * GET, HEAD, PUT and DELETE requests on 500, 502 and 504, or on timeouts and lost connections
+
+        The Retry-After header of the VSD is honoured, otherwise the
+        delay is random and doubles on each retry, starting at
+        `VSD_RETRY_BACKOFF` seconds.
+
+    """
+
+    DEFAULT_POOL_SIZE = 10
+    DEFAULT_CONNECT_TIMEOUT = 10
+    TLS_VERSIONS = ['TLSv1', 'TLSv1_1', 'TLSv1_2']
+    DEFAULT_RETRIES = 3
+    DEFAULT_RETRY_BACKOFF = 0.5
+    IDEMPOTENT_METHODS = ['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS']
+    RETRY_STATUSES = [429, 503]
+    IDEMPOTENT_RETRY_STATUSES = [500, 502, 504]
+    OVERLOAD_STATUSES = [429, 502, 503, 504]
+    IDENTIFIER = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+
+    exceptions = requests.exceptions
+
+    _session = None
+    _scheduler = None
+    _scheduler_settings = None
+    _pool_size = DEFAULT_POOL_SIZE
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, pool_size=None):
+        """ Set the number of connections kept per VSD and check environment variables
+
+            The session is created again when the size changes, and the
+            scheduler when the size or one of its variables changes, so
+            that consecutive commands of a shell or a daemon keep the
+            concurrency limit learned from the VSD.
+
+            Args:
+                pool_size: the number of threads sending requests
+
+            Raises:
+                ValueError if an environment variable is invalid
+
+        """
+        if os.environ.get('VSD_TLS_VERSION', cls.TLS_VERSIONS[0]) not in cls.TLS_VERSIONS:
+            raise ValueError('VSD_TLS_VERSION must be one of %s' % ', '.join(cls.TLS_VERSIONS))
+
+        for name in ['VSD_CONNECT_TIMEOUT', 'VSD_READ_TIMEOUT']:
+            if cls._get_number(name, None) == 0:
+                raise ValueError('%s must be a positive number' % name)
+
+        pool_size = cls._get_number('VSD_POOL_SIZE', 0, int) or max(cls.DEFAULT_POOL_SIZE, pool_size or 0)
+        scheduler_settings = (cls._get_number('VSD_RATE_LIMIT', 0),
+                              cls._get_number('VSD_RETRIES', cls.DEFAULT_RETRIES, int),
+                              cls._get_number('VSD_RETRY_BACKOFF', cls.DEFAULT_RETRY_BACKOFF))
+
+        with cls._lock:
+            if pool_size != cls._pool_size and cls._session is not None:
+                cls._session.close()
+                cls._session = None
+
+            if pool_size != cls._pool_size or scheduler_settings != cls._scheduler_settings:
+                cls._scheduler = None
+
+            cls._pool_size = pool_size
+            cls._scheduler_settings = scheduler_settings
+
+    @classmethod
+    def request(cls, method, url, **kwargs):
+        """ Send a request like `requests.request`
+
+            Timeout given by the caller is used as read timeout
+            unless `VSD_READ_TIMEOUT` is set.
+
+            Returns:
+                A requests Response
+
+        """
+        read_timeout = os.environ.get('VSD_READ_TIMEOUT')
+        read_timeout = float(read_timeout) if read_timeout else kwargs.get('timeout')
+        kwargs['timeout'] = (float(os.environ.get('VSD_CONNECT_TIMEOUT', cls.DEFAULT_CONNECT_TIMEOUT)), read_timeout)
+
+        session = cls.get_session()
+        method = method.upper()
+
+        def send():
+            with Profiler.phase('http %s' % method):
+                response = session.request(method=method, url=url, **kwargs)
+
+            if Profiler.enabled:
+                response.json = Profiler.profiled('deserialize')(response.json)
+
+            return response
+
+        def classify(response, error):
+            return cls._classify(method, response, error)
+
+        with Profiler.phase('request %s' % method):
+            return cls.get_scheduler().run(cls._get_kind(method, url, kwargs.get('headers')), send, classify)
+
+    @classmethod
+    def get_scheduler(cls):
+        """ Returns the scheduler of requests, creating it if needed
+
+        """
+        if cls._scheduler is None:
+            with cls._lock:
+                if cls._scheduler is None:
+                    (rate, retries, backoff) = cls._scheduler_settings or (0, cls.DEFAULT_RETRIES, cls.DEFAULT_RETRY_BACKOFF)
+                    cls._scheduler = RetryScheduler(rate=rate, concurrency=cls._pool_size, retries=retries, backoff=backoff)
+
+        return cls._scheduler
+
+    @classmethod
+    def get_session(cls):
+        """ Returns the requests session, creating it if needed
+
+        """
+        if cls._session is None:
+            with cls._lock:
+                if cls._session is None:
+                    adapter = TransportAdapter(cls._get_ssl_context(), pool_connections=cls._pool_size, pool_maxsize=cls._pool_size, max_retries=0)
+                    session = requests.Session()
+                    session.headers['Accept-Encoding'] = 'gzip, deflate'
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    cls._session = session
+
+        return cls._session
+
+    @classmethod
+    def _get_number(cls, name, default, number_type=float):
+        """ Returns the number of an environment variable
+
+            Args:
+                name: the name of the variable
+                default: the value when the variable is not set
+                number_type: int or float
+
+            Raises:
+                ValueError if the variable is not a number or is negative
+
+        """
+        value = os.environ.get(name)
+
+        if not value:
+            return default
+
+        try:
+            number = number_type(value)
+        except ValueError:
+            number = -1
+
+        if number < 0:
+            raise ValueError('%s must be a %s instead of %s' % (name, 'non-negative integer' if number_type is int else 'non-negative number', value))
+
+        return number
+
+    @classmethod
+    def _get_kind(cls, method, url, headers=None):
+        """ Returns the kind of a request, whose latencies are compared by the scheduler
+
+            Requests of a kind return responses of similar sizes: the
+            method, the resource, whether it is a listing and its page
+            size are taken into account.
+
+        """
+        path = urlparse.urlparse(url).path.rstrip('/').split('/')
+
+        if len(path) > 1 and cls.IDENTIFIER.match(path[-1]):
+            return (method, path[-2], None)
+
+        return (method, path[-1], (headers or {}).get('X-Nuage-PageSize'))
+
+    @classmethod
+    def _classify(cls, method, response, error):
+        """ Tells whether a request can be retried
+
+            Args:
+                method: the HTTP method of the request
+                response: the response of the request or None
+                error: the exception raised by the request or None
+
+            Returns:
+                A tuple (retry, overloaded, delay) as expected by RetryScheduler
+
+        """
+        idempotent = method in cls.IDEMPOTENT_METHODS
+
+        if error is not None:
+            if isinstance(error, requests.exceptions.ConnectTimeout):
+                return (True, True, None)
+
+            if isinstance(error, requests.exceptions.ConnectionError) and isinstance(getattr(error.args[0] if error.args else None, 'reason', None), NewConnectionError):
+                return (True, False, None)
+
+            if isinstance(error, requests.exceptions.Timeout):
+                return (idempotent, True, None)
+
+            if isinstance(error, requests.exceptions.ConnectionError):
+                return (idempotent, False, None)
+
+            return (False, False, None)
+
+        status = response.status_code
+        overloaded = status in cls.OVERLOAD_STATUSES
+        retry = status in cls.RETRY_STATUSES or (idempotent and status in cls.IDEMPOTENT_RETRY_STATUSES)
+
+        return (retry, overloaded, cls._get_retry_after(response) if retry else None)
+
+    @classmethod
+    def _get_retry_after(cls, response):
+        """ Returns the number of seconds asked by the Retry-After header or None """
+
+        try:
+            return max(0.0, float(response.headers.get('Retry-After')))
+        except (TypeError, ValueError):
+            return None
+
+    @classmethod
+    def _get_ssl_context(cls):
+        """ Returns the TLS context of connections """
+
+        tls_version = os.environ.get('VSD_TLS_VERSION')
+        protocol = getattr(ssl, 'PROTOCOL_%s' % tls_version) if tls_version else ssl.PROTOCOL_SSLv23
+
+        # Certificates are not verified, like bambou does
+        return create_urllib3_context(ssl_version=protocol, cert_reqs=ssl.CERT_NONE)
@@ -27,79 +27,67 @@
 
 import logging
 import importlib
-import re
-import pkg_resources
+import requests
+import threading
 
+from functools import wraps
+from bambou import nurest_connection
 from bambou.exceptions import BambouHTTPError
+from bambou.nurest_connection import NURESTConnection
+from cache import SessionCache
+from index import VSDKIndex
+from names import Names
 from printer import Printer
+from profiler import Profiler
+from transport import Transport
 
 
-class Utils(object):
-    """ Utils """
+requests.packages.urllib3.disable_warnings()
 
-    INVARIANT_RESOURCES = ['qos', 'vrs', 'cms']
 
-    @classmethod
-    def _clean_name(cls, string):
-        """ String cleaning for specific cases
+## bambou sends its requests through the vsdcli transport instead of the requests module
+nurest_connection.requests = Transport
 
-            This is very specific and is used to force
-            some underscore while using get_python_name.
 
-            Args:
-                string: the string to clean
+## Monkey patch to log in again when the VSD rejects a cached API key
+def refresh_api_key(func):
+    @wraps(func)
+    def bar(self, session=None):
+        api_key = session.login_controller.api_key if session else None
+        connection = func(self, session=session)
+        refresh = getattr(session, 'refresh_api_key', None)
+        response = getattr(connection, 'response', None)
 
-            Returns:
-                Returns a clean string
-        """
-        rep = {
-            "VPort": "Vport",
-            "IPID": "IpID"
-        }
+        if refresh and response is not None and response.status_code == 401 and refresh(api_key):
+            connection = func(self, session=session)
+
+        return connection
+    return bar
+
+NURESTConnection._make_request = refresh_api_key(NURESTConnection._make_request)
+## end of monkey patch
 
-        rep = dict((re.escape(k), v) for k, v in rep.iteritems())
-        pattern = re.compile("|".join(rep.keys()))
-        return pattern.sub(lambda m: rep[re.escape(m.group(0))], string)
+
+class Utils(object):
+    """ Utils """
 
     @classmethod
     def get_python_name(cls, name):
         """ Transform a given name to python name """
-        first_cap_re = re.compile('(.)([A-Z](?!s([A-Z])*)[a-z]+)')
-        all_cap_re = re.compile('([a-z0-9])([A-Z])')
 
-        s1 = first_cap_re.sub(r'\1_\2', Utils._clean_name(name))
-        return all_cap_re.sub(r'\1_\2', s1).lower()
+        return Names.get_python_name(name)
 
     @classmethod
     def get_singular_name(cls, plural_name):
         """ Returns the singular name of the plural name """
 
-        if plural_name in Utils.INVARIANT_RESOURCES:
-            return plural_name
-
-        if plural_name[-3:] == 'ies':
-            return plural_name[:-3] + 'y'
-
-        if plural_name[-1] == 's':
-            return plural_name[:-1]
-
-        return plural_name
+        return Names.get_singular_name(plural_name)
 
     @classmethod
     def get_plural_name(cls, singular_name):
         """ Returns the plural name of the singular name """
 
-        if singular_name in Utils.INVARIANT_RESOURCES:
-            return singular_name
-
-        vowels = ['a', 'e', 'i', 'o', 'u', 'y']
-        if singular_name[-1:] == 'y' and singular_name[-2] not in vowels:
-            return singular_name[:-1] + 'ies'
-
-        if singular_name[-1:] == 's':
-            return singular_name
-
-        return singular_name + 's'
+        return Names.get_plural_name(singular_name)
 
     @classmethod
     def get_vspk_version(cls, version):
@@ -124,44 +112,90 @@ class VSDKInspector(object):
 
     """
 
+    _inspectors = dict()
+    _sessions = dict()
+
     def __init__(self, version=None):
         """ Initializes
 
         """
-        if version:
-            self._version = Utils.get_vspk_version(version)
-
+        self._version = Utils.get_vspk_version(version) if version else None
         self._objects_mapping = {}
         self._ignored_resources = ['me']
         self._vsdk = None
+        self._vsdk_package_name = None
+        self._index = None
 
         self._load_objects()
 
+    @classmethod
+    def get_inspector(cls, version=None):
+        """ Get the inspector of a version
+
+            Inspectors are kept for the lifetime of the process, so
+            that long-running processes load the VSDK only once.
+
+            Args:
+                version: the version of the API
+
+            Returns:
+                A VSDKInspector
+
+        """
+        if version not in cls._inspectors:
+            cls._inspectors[version] = cls(version)
+
+        return cls._inspectors[version]
+
+    @Profiler.profiled('model')
     def _load_objects(self):
-        """ Load objects in a temporary database
+        """ Load objects from the VSDK index
+
+            The VSDK package itself is only imported when
+            a command needs one of its classes.
 
         """
-        self._get_vsdk_package()
+        (package_name, package_path) = self._find_vsdk_package()
+        self._index = VSDKIndex.get_index(package_name, package_path, loader=self._get_vsdk_package)
+
+        resource_names = dict()
+
+        for rest_name in self._index.get_rest_names():
+            self._objects_mapping[rest_name] = self._index.get_class_name(rest_name)
+            resource_names[rest_name] = self._index.get_resource_name(rest_name)
+
+        Names.register(resource_names)
+
+    def _find_vsdk_package(self):
+        """ Returns the name and path of the vsdk package
+
+        """
+        package_names = ['vsdk']
+
+        if self._version:
+            package_names.insert(0, 'vspk.vsdk.%s' % self._version)
+
+        for package_name in package_names:
+            package_path = VSDKIndex.find_package(package_name)
 
-        object_names = [name for name in dir(self._vsdk) if name != 'NUVSDSession' and name.startswith('NU') and not name.endswith('Fetcher') and name != 'NURESTModelController']
+            if package_path:
+                self._vsdk_package_name = package_name
+                return (package_name, package_path)
 
-        for object_name in object_names:
-            obj = getattr(self._vsdk, object_name)
-            self._objects_mapping[obj.rest_name] = object_name
+        Printer.raise_error('Please install requirements using command line `pip install -r requirements.txt`.\nNo module named %s' % ' or '.join(package_names))
 
     def _get_vsdk_package(self):
         """ Returns vsdk package
 
         """
         if self._vsdk is None:
+            if self._vsdk_package_name is None:
+                self._find_vsdk_package()
+
             try:
-                self._vsdk = importlib.import_module('vspk.vsdk.%s' % self._version)
-                # Printer.info('Imported vsdk.%s from VSPK.' % self._version)
-            except ImportError:
-                try:
-                    self._vsdk = importlib.import_module('vsdk')
-                except ImportError as error:
-                    Printer.raise_error('Please install requirements using command line `pip install -r requirements.txt`.\n%s' % error)
+                self._vsdk = importlib.import_module(self._vsdk_package_name)
+            except ImportError as error:
+                Printer.raise_error('Please install requirements using command line `pip install -r requirements.txt`.\n%s' % error)
 
         return self._vsdk
 
@@ -189,7 +223,7 @@ class VSDKInspector(object):
 
             klass = None
             try:
-                klass = getattr(self._vsdk, classname)
+                klass = getattr(self._get_vsdk_package(), classname)
             except:
                 Printer.raise_error('Unknown class %s' % classname)
 
@@ -197,6 +231,100 @@ class VSDKInspector(object):
 
         Printer.raise_error('Unknown object named %s' % name)
 
+    def has_object(self, name):
+        """ Returns True if the object is known
+
+            Args:
+                name: the name of the object
+
+        """
+        return name in self._objects_mapping
+
+    def get_children_rest_names(self, name):
+        """ Get children rest names of an object
+
+            Args:
+                name: the name of the object
+
+            Returns:
+                a list of rest names
+
+        """
+        if not self._index.has_object(name):
+            Printer.raise_error('Unknown object named %s' % name)
+
+        return self._index.get_children_rest_names(name)
+
+    def get_parent_rest_names(self, name):
+        """ Get parents rest names of an object
+
+            Args:
+                name: the name of the object
+
+            Returns:
+                a list of rest names
+
+        """
+        if not self._index.has_object(name):
+            Printer.raise_error('Unknown object named %s' % name)
+
+        return [rest_name for rest_name in self._index.get_parent_rest_names(name) if rest_name not in self._ignored_resources]
+
+    def find_path(self, from_name, to_name):
+        """ Find how to reach an object from another one through children
+
+            Args:
+                from_name: the name of the first object
+                to_name: the name of the object to reach
+
+            Returns:
+                a list of rest names starting with from_name or None
+
+        """
+        for name in (from_name, to_name):
+            if not self._index.has_object(name):
+                Printer.raise_error('Unknown object named %s' % name)
+
+        return self._index.find_path(from_name, to_name)
+
+    def get_resource_name(self, name):
+        """ Get the resource name of an object
+
+            Args:
+                name: the name of the object
+
+            Returns:
+                the name used in URLs of the object
+
+        """
+        if not self._index.has_object(name):
+            Printer.raise_error('Unknown object named %s' % name)
+
+        return self._index.get_resource_name(name)
+
+    def get_column_widths(self, name):
+        """ Get the widths of columns known from the VSDK metadata
+
+            Args:
+                name: the name of the object
+
+            Returns:
+                A dictionary of widths by remote name
+
+        """
+        widths = dict()
+
+        if not self._index.has_object(name):
+            return widths
+
+        for attribute in self._index.get_attributes(name).values():
+            if attribute['choices']:
+                widths[attribute['remote_name']] = max([len(choice) for choice in attribute['choices']])
+            elif attribute['type'] == 'bool':
+                widths[attribute['remote_name']] = len('False')
+
+        return widths
+
     def get_vsdk_instance(self, name):
         """ Get VSDK object instance according to a given name
 
@@ -213,6 +341,11 @@ class VSDKInspector(object):
         """ Get VSDK parent object if possible
             Otherwise it will take the user
 
+            The parent is not fetched: its rest name and its ID are
+            enough to build the URLs of its children. A missing parent
+            is detected when the VSD answers 404 to a request on its
+            children (see `check_parent_error`).
+
             Args:
                 parent_infos: a list composed of (parent_name, uuid)
 
@@ -228,18 +361,55 @@ class VSDKInspector(object):
             parent = self.get_vsdk_instance(singular_name)
             parent.id = uuid
 
-            try:
-                (parent, connection) = parent.fetch()
-            except Exception, ex:
-                Printer.raise_error('Failed fetching parent %s with uuid %s\n%s' % (name, uuid, ex))
-
             return parent
 
         return user
 
+    @classmethod
+    def check_parent_error(cls, parent, error):
+        """ Report a missing parent
+
+            Prints an error and exits if the error is a 404 returned
+            by a request on children of the parent. Does nothing
+            otherwise.
+
+            Args:
+                parent: the parent returned by `get_vsdk_parent`
+                error: the exception raised by the request
+
+        """
+        message = cls.get_parent_error(parent, error)
+
+        if message:
+            Printer.raise_error(message)
+
+    @classmethod
+    def get_parent_error(cls, parent, error):
+        """ Returns the message of a missing parent or None
+
+            Args:
+                parent: the parent returned by `get_vsdk_parent`
+                error: the exception raised by a request on its children
+
+        """
+        if parent is None or parent.rest_name == 'me' or not isinstance(error, BambouHTTPError):
+            return None
+
+        if error.connection.response.status_code != 404:
+            return None
+
+        return 'Failed fetching parent %s with uuid %s\n%s' % (parent.rest_name, parent.id, error)
+
+    @Profiler.profiled('login')
     def get_user_session(self, args):
         """ Get api key
 
+            Sessions are kept for the lifetime of the process. The API key
+            is taken from the session cache when possible. Otherwise a new
+            session is started and its API key is stored in the cache for
+            the next commands. Whenever the VSD rejects the API key, the
+            session logs in again.
+
             Args:
                 username: username to get an api key
                 password: password to get an api key
@@ -250,7 +420,44 @@ class VSDKInspector(object):
                 Returns an API Key if everything works fine
         """
         self._set_verbose_mode(args.verbose)
-        session = self._vsdk.NUVSDSession(username=args.username, password=args.password, enterprise=args.enterprise, api_url=args.api)
+        session_key = (args.api, args.enterprise, args.username, args.version, args.password)
+
+        if session_key in VSDKInspector._sessions:
+            session = VSDKInspector._sessions[session_key]
+            session.start()
+            return session
+
+        session = self._get_vsdk_package().NUVSDSession(username=args.username, password=args.password, enterprise=args.enterprise, api_url=args.api)
+
+        if args.session_cache:
+            cache = SessionCache()
+
+            with cache.lock():
+                user_dict = cache.get(args.api, args.enterprise, args.username, args.version, args.password)
+
+                if user_dict:
+                    self._restore_session(session, user_dict)
+                else:
+                    self._start_session(session, args)
+                    cache.set(args.api, args.enterprise, args.username, args.version, args.password, session.user)
+        else:
+            cache = None
+            self._start_session(session, args)
+
+        # Sessions are kept by daemons and shells after their API key expires
+        self._set_refresh(session, args, cache)
+        VSDKInspector._sessions[session_key] = session
+
+        return session
+
+    def _start_session(self, session, args):
+        """ Start a session by logging in to the VSD
+
+            Args:
+                session: the session to start
+                args: command line arguments
+
+        """
         try:
             session.start()
         except BambouHTTPError as error:
@@ -265,7 +472,73 @@ class VSDKInspector(object):
         if user.api_key is None:
             Printer.raise_error('Could not get a valid API key. Activate verbose mode for more information')
 
-        return session
+    def _restore_session(self, session, user_dict):
+        """ Start a session from a cached user without logging in
+
+            Args:
+                session: the session to start
+                user_dict: the cached REST user
+
+        """
+        user = session.create_rest_user()
+        user.from_dict(user_dict)
+
+        session._user = user
+        session.start()
+
+    def _set_refresh(self, session, args, cache):
+        """ Log in again whenever the VSD rejects the API key of a session
+
+            Args:
+                session: the session to refresh
+                args: command line arguments
+                cache: the session cache to update or None
+
+        """
+        session.refresh_lock = threading.Lock()
+        session.refreshing_thread = None
+        session.refresh_api_key = lambda api_key: self._refresh_session(session, args, cache, api_key)
+
+    def _refresh_session(self, session, args, cache, rejected_key):
+        """ Log in again after the VSD rejected an API key
+
+            Threads rejected at the same time wait for a single login,
+            then send their request again with the new API key.
+            Requests sent by the login itself are never refreshed.
+
+            Args:
+                session: the session to refresh
+                args: command line arguments
+                cache: the session cache to update or None
+                rejected_key: the API key of the rejected request
+
+            Returns:
+                True if the rejected request can be sent again
+
+        """
+        if session.refreshing_thread is threading.current_thread():
+            return False
+
+        with session.refresh_lock:
+            # Another thread logged in while this one was waiting
+            if session.login_controller.api_key != rejected_key:
+                return True
+
+            session.refreshing_thread = threading.current_thread()
+
+            try:
+                if cache is None:
+                    session.reset()
+                    self._start_session(session, args)
+                else:
+                    with cache.lock():
+                        session.reset()
+                        self._start_session(session, args)
+                        cache.set(args.api, args.enterprise, args.username, args.version, args.password, session.user)
+            finally:
+                session.refreshing_thread = None
+
+        return True
 
     def _set_verbose_mode(self, verbose):
         """ Defines verbosity
@@ -276,6 +549,6 @@ class VSDKInspector(object):
         """
         if verbose:
             Printer.info('Verbose mode is now activated.')
-            self._vsdk.set_log_level(logging.DEBUG)
+            self._get_vsdk_package().set_log_level(logging.DEBUG)
         else:
-            self._vsdk.set_log_level(logging.ERROR)
+            self._get_vsdk_package().set_log_level(logging.ERROR)
@@ -26,14 +26,20 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import argparse
+import hashlib
+import os
+import signal
 import sys
+import time
 
 sys.path.append("../")
 
+from profiler import Profiler
+
 class _HelpAction(argparse._HelpAction):
 
     def __call__(self, parser, namespace, values, option_string=None):
-        parser.print_help()
+        help_text = parser.format_help()
 
         subparsers_actions = [
             action for action in parser._actions
@@ -42,13 +48,107 @@ class _HelpAction(argparse._HelpAction):
         for subparsers_action in subparsers_actions:
 
             for choice, subparser in subparsers_action.choices.items():
-                print("\n{}:\n{}".format(choice.upper(), '-' * (len(choice) + 1)))
-                print(subparser.format_help())
+                help_text += "\n{}:\n{}\n".format(choice.upper(), '-' * (len(choice) + 1))
+                help_text += subparser.format_help() + "\n"
 
+        sys.stdout.write(help_text)
+        save_help(help_text)
         parser.exit()
 
 
-def main(argv=sys.argv):
+def get_help_path(directory):
+    """ Returns the path of the stored help text
+
+        The name of the file changes with the installed vsdcli
+        and the width of the terminal.
+
+    """
+    stamp = '%s:%s:%s' % (os.path.abspath(__file__), os.path.getmtime(__file__), os.environ.get('COLUMNS', ''))
+
+    return os.path.join(directory, 'help-%s.txt' % hashlib.sha1(stamp).hexdigest()[:12])
+
+
+def save_help(help_text):
+    """ Store the help text so that next `vsd --help` does not build the parser
+
+    """
+    from cache import get_cache_directory
+
+    try:
+        path = get_help_path(get_cache_directory())
+
+        with open(path + '.tmp', 'w') as help_file:
+            help_file.write(help_text)
+
+        os.rename(path + '.tmp', path)
+    except (IOError, OSError):
+        pass
+
+
+def print_saved_help():
+    """ Print the stored help text
+
+        Returns:
+            True if the help text was stored
+
+    """
+    # Directory of cache.get_cache_directory, read without importing cache
+    directory = os.path.expanduser(os.environ.get('VSD_CACHE_DIRECTORY', '~/.vsdcli'))
+
+    try:
+        with open(get_help_path(directory)) as help_file:
+            sys.stdout.write(help_file.read())
+    except (IOError, OSError):
+        return False
+
+    return True
+
+
+_parser = None
+
+
+def positive_int(value):
+    """ Argument type of numbers greater than 0
+
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+
+    if number < 1:
+        raise argparse.ArgumentTypeError('%s is not a positive number' % value)
+
+    return number
+
+
+def add_parent_arguments(parser):
+    """ Add the arguments selecting one or several parents
+
+    """
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--in', dest='parent_infos', nargs='+', metavar=('PARENT_NAME', 'PARENT_UUID'), help="Specify the parent name and one or several uuids")
+    group.add_argument('--in-all', dest='in_all', metavar='PARENT_NAME', help="Use every parent of this kind as parent (ex: --in-all enterprises)")
+    parser.add_argument('--in-filter', dest='in_filter', help="Specify a filter predicate selecting parents of --in-all")
+
+
+def add_query_arguments(parser):
+    """ Add arguments of the client-side query
+
+    """
+    parser.add_argument('--sort', dest='sort', nargs='+', metavar='FIELD[:desc]', help="Sort results by these fields, ascending unless followed by `:desc`. Results larger than `VSD_SORT_BUFFER_SIZE` objects are sorted on disk")
+    parser.add_argument('--group-by', dest='group_by', nargs='+', metavar='FIELD', help="Print one row of aggregates per distinct value of these fields (default aggregate: count)")
+    parser.add_argument('--agg', dest='aggregates', nargs='+', metavar='AGGREGATE', help="Aggregates of all results, or of each group: count, sum:FIELD, min:FIELD or max:FIELD")
+
+
+def get_parser():
+    """ Returns the argument parser of the CLI
+
+    """
+    global _parser
+
+    if _parser is not None:
+        return _parser
 
     default_parser = argparse.ArgumentParser(description="CLI for VSD Software Development Kit", add_help=False)
     default_parser.add_argument('-v', '--verbose', help='Activate verbose mode', action='store_true')
@@ -58,6 +158,13 @@ def main(argv=sys.argv):
     default_parser.add_argument('--version', help='Version of the API or set `VSD_API_VERSION` in your variable environment')
     default_parser.add_argument('--enterprise', help='Name of the enterprise to connect or set `VSD_ENTERPRISE` in your variable environment')
     default_parser.add_argument('--json', help='Add this option get a JSON output or set VSD_JSON_OUTPUT="True"', action='store_true')
+    default_parser.add_argument('-o', '--output', dest='output', choices=['table', 'json', 'ndjson', 'csv', 'tsv'], help='Output format or set `VSD_OUTPUT` in your variable environment (default: table). ndjson prints one JSON object per line')
+    default_parser.add_argument('--compact', help='Print JSON without indentation', action='store_true')
+    default_parser.add_argument('--cache', dest='response_cache', help='Reuse VSD responses cached on disk or set VSD_RESPONSE_CACHE="True"', action='store_const', const=True, default=None)
+    default_parser.add_argument('--no-cache', dest='response_cache', help='Do not use the response cache even if VSD_RESPONSE_CACHE="True"', action='store_const', const=False)
+    default_parser.add_argument('--refresh', help='Fetch responses from the VSD and update the response cache', action='store_true')
+    default_parser.add_argument('--profile', nargs='?', const='table', choices=Profiler.FORMATS, help='Print the time spent in each phase of the command on the error output or set `VSD_PROFILE` in your variable environment (default format: table)')
+    default_parser.add_argument('--no-session-cache', dest='session_cache', help='Always log in instead of reusing a cached API key or set VSD_SESSION_CACHE="False"', action='store_false')
 
     parser = argparse.ArgumentParser(description="CLI for VSD Software Development Kit", add_help=False)
     parser.add_argument('-h', '--help', action=_HelpAction, help='help for help if you need some help')
@@ -68,22 +175,34 @@ def main(argv=sys.argv):
     # List Command
     list_parser = subparsers.add_parser('list', description="List all objects", parents=[default_parser])
     list_parser.add_argument('list', help="Name of the VSD object (See command `objects` to list all objects name)")
-    list_parser.add_argument('--in', dest='parent_infos', nargs=2, help="Specify the PARENT_NAME and PARENT_UUID")
     list_parser.add_argument('-f', '--filter', dest='filter', help="Specify a filter predicate")
     list_parser.add_argument('-x', '--fields', dest='fields', help="Specify output fields", nargs='+', type=str)
+    list_parser.add_argument('--page-size', dest='page_size', help="Number of objects fetched per request or set `VSD_PAGE_SIZE` in your variable environment (default: 500)", type=positive_int)
+    list_parser.add_argument('--parallel', dest='parallel', help="Number of pages or parents fetched at the same time (default: 1)", type=positive_int, default=1)
+    list_parser.add_argument('--typed', dest='typed', help="Build VSDK objects from responses instead of printing them as sent by the VSD", action='store_true')
+    add_parent_arguments(list_parser)
+    add_query_arguments(list_parser)
+    list_parser.add_argument('--from-snapshot', dest='from_snapshot', metavar='FILE', help="Read objects from a snapshot saved by `snapshot` command instead of the VSD")
 
     # Count Command
     list_parser = subparsers.add_parser('count', description="Count all objects", parents=[default_parser])
     list_parser.add_argument('count', help="Name of the VSD object (See command `objects` to list all objects name)")
-    list_parser.add_argument('--in', dest='parent_infos', nargs=2, help="Specify the parent name and its uuid")
     list_parser.add_argument('-f', '--filter', dest='filter', help="Specify a filter predicate")
     list_parser.add_argument('-x', '--fields', dest='fields', help="Specify output fields", nargs='+', type=str)
+    list_parser.add_argument('--parallel', dest='parallel', help="Number of parents counted at the same time (default: 1)", type=positive_int, default=1)
+    list_parser.add_argument('--typed', dest='typed', help="Build VSDK objects from responses instead of printing them as sent by the VSD", action='store_true')
+    add_parent_arguments(list_parser)
+    add_query_arguments(list_parser)
+    list_parser.add_argument('--from-snapshot', dest='from_snapshot', metavar='FILE', help="Read objects from a snapshot saved by `snapshot` command instead of the VSD")
 
     # Show Command
     show_parser = subparsers.add_parser('show', description="Show a specific object", parents=[default_parser])
     show_parser.add_argument('show', help="Name of the object to show (See command `objects` to list all objects name)")
-    show_parser.add_argument('-i', '--id', dest='id', help='Identifier of the object to show', required=True)
+    show_parser.add_argument('-i', '--id', dest='id', nargs='+', help='Identifiers of the objects to show', required=True)
     show_parser.add_argument('-x', '--fields', dest='fields', help="Specify output fields", nargs='+', type=str)
+    show_parser.add_argument('--parallel', dest='parallel', help="Number of objects fetched at the same time (default: 1)", type=positive_int, default=1)
+    show_parser.add_argument('--typed', dest='typed', help="Build VSDK objects from responses instead of printing them as sent by the VSD", action='store_true')
+    show_parser.add_argument('--from-snapshot', dest='from_snapshot', metavar='FILE', help="Read objects from a snapshot saved by `snapshot` command instead of the VSD")
 
     # Create Command
     create_parser = subparsers.add_parser('create', description="Create a new object", parents=[default_parser])
@@ -120,16 +239,88 @@ def main(argv=sys.argv):
     assign_parser.add_argument('--ids', dest='ids', nargs='*', help='Identifier of the object to reassign. If --ids is not specified, it will remove all assigned objects')
     assign_parser.add_argument('--to', dest='parent_infos', nargs=2, help="Specify the resource name and its uuid", required=True)
 
+    # Apply Command
+    apply_parser = subparsers.add_parser('apply', description="Create, update or delete objects listed in a file", parents=[default_parser])
+    apply_parser.add_argument('-f', '--file', dest='file', help='Path of a JSON lines, JSON, YAML or CSV file of operations. Use - to read JSON lines from standard input', required=True)
+    apply_parser.add_argument('-c', '--concurrency', dest='concurrency', help='Number of operations sent at the same time (default: 4)', type=positive_int, default=4)
+    apply_parser.add_argument('--rate', dest='rate', help='Maximum number of operations per second', type=float)
+    apply_parser.add_argument('--continue-on-error', dest='continue_on_error', help='Keep applying operations after a failure', action='store_true')
+
+    # Snapshot Command
+    snapshot_parser = subparsers.add_parser('snapshot', description="Save an object and all its descendants in a local file", parents=[default_parser])
+    snapshot_parser.add_argument('snapshot', help='Name of the object to save (ex: enterprise)')
+    snapshot_parser.add_argument('-i', '--id', dest='id', help='Identifier of the object to save', required=True)
+    snapshot_parser.add_argument('-f', '--file', dest='file', help='Path of the snapshot file', required=True)
+    snapshot_parser.add_argument('--parallel', dest='parallel', help="Number of requests sent at the same time (default: 4)", type=positive_int, default=4)
+    snapshot_parser.add_argument('--incremental', dest='incremental', help='Only fetch objects updated since the snapshot was last saved, and remove deleted ones. Sends as many requests as a full snapshot plus counts of saved children, with smaller responses', action='store_true')
+    snapshot_parser.add_argument('--exclude', dest='exclude', nargs='*', help="Children that are not saved (default: eventlogs statistics jobs)")
+
     # Resources Command
     objects_parser = subparsers.add_parser('objects', description="Explore all VSD objects", parents=[default_parser])
     objects_parser.add_argument('-f', '--filter', dest='filter', help='Filter by name (ex: -f nsg)')
     objects_parser.add_argument('-p', '--parent', dest='parent', help='Filter by parent (ex -p enterprise)')
     objects_parser.add_argument('-c', '--child', dest='child', help='Filter by children (ex: -c domain)')
+    objects_parser.add_argument('-t', '--path-to', dest='path_to', help='Show the objects to go through to reach an object from the parent given by -p or from the root (ex: -p enterprise -t vport)')
+
+    # Shell Command
+    subparsers.add_parser('shell', description="Start an interactive shell that keeps the VSDK and sessions loaded")
+
+    # Daemon Command
+    daemon_parser = subparsers.add_parser('daemon', description="Serve commands forwarded by vsd clients when `VSD_DAEMON_SOCKET` is set")
+    daemon_parser.add_argument('-s', '--socket', dest='socket', help='Path of the Unix socket or set `VSD_DAEMON_SOCKET` in your variable environment')
+
+    _parser = parser
+    return _parser
+
+
+def start_profiler(args):
+    """ Enable profiling when asked by `--profile` or `VSD_PROFILE`
+
+    """
+    try:
+        Profiler.start(getattr(args, 'profile', None) or os.environ.get('VSD_PROFILE'))
+    except ValueError, e:
+        from printer import Printer
+        Printer.raise_error(str(e))
+
+
+def main(argv=sys.argv):
+
+    if argv[1:] in (['-h'], ['--help']) and print_saved_help():
+        sys.exit(0)
+
+    socket_path = os.environ.get('VSD_DAEMON_SOCKET', None)
+
+    # Exit quietly when the output, local or forwarded, is piped to a command like `head`
+    if argv[1:2] not in (['shell'], ['daemon']):
+        signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+    # apply reads files and standard input of the client so it is never forwarded
+    if socket_path and argv[1:2] not in (['shell'], ['daemon'], ['apply']):
+        from daemon import VSDClient
+        exit_code = VSDClient.forward(socket_path, argv[1:])
+
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    args = get_parser().parse_args(argv[1:])
+
+    if args.command == 'shell':
+        from daemon import VSDShell
+        VSDShell().cmdloop()
+
+    elif args.command == 'daemon':
+        from daemon import VSDDaemon
+        VSDDaemon.serve(args.socket)
+
+    else:
+        start_profiler(args)
 
-    args = parser.parse_args()
+        start = time.time()
+        from commands import VSDCommand
+        Profiler.record('imports', time.time() - start)
 
-    from commands import VSDCommand
-    VSDCommand.execute(args)
+        VSDCommand.execute(args)
 
 
 if __name__ == '__main__':